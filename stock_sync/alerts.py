@@ -0,0 +1,141 @@
+# stock_sync/alerts.py - low-stock alerts evaluated against the rows a sync changed
+import frappe
+from frappe.utils import add_to_date, cint, escape_html, flt, get_datetime, now_datetime
+
+RULE_INDEX_CACHE_KEY = "stock_sync:alert_rule_index"
+ALERT_STATE_CACHE_KEY = "stock_sync:alert_state"
+
+
+def get_rule_index():
+	"""
+	Enabled Stock Alert Rules grouped by item_code, cached until a rule changes
+	"""
+	cache = frappe.cache()
+	index = cache.get_value(RULE_INDEX_CACHE_KEY)
+	if index is not None:
+		return index
+
+	index = {}
+	for rule in frappe.get_all(
+		"Stock Alert Rule",
+		filters={"enabled": 1},
+		fields=[
+			"name",
+			"item_code",
+			"source_site",
+			"warehouse",
+			"threshold",
+			"notify_user",
+			"debounce_minutes",
+		],
+	):
+		index.setdefault(rule.item_code, []).append(rule)
+
+	cache.set_value(RULE_INDEX_CACHE_KEY, index)
+	return index
+
+
+def clear_rule_index():
+	frappe.cache().delete_value(RULE_INDEX_CACHE_KEY)
+
+
+def get_changed_rows(diff):
+	"""
+	Rows whose available_qty may have moved in a sync: inserts, updates,
+	and deleted rows (which now have nothing available)
+	"""
+	rows = list(diff["inserts"])
+	rows.extend(row for name, row in diff["updates"])
+	rows.extend(
+		{
+			"origin_site": row.origin_site,
+			"item_code": row.item_code,
+			"warehouse": row.warehouse,
+			"available_qty": 0.0,
+		}
+		for row in diff["deleted_rows"]
+	)
+	return rows
+
+
+def evaluate_alerts(site_name, changed_rows):
+	"""
+	Check the rules watching each changed row and notify on downward crossings.
+	Only items that have rules are looked at, so cost follows the changed rows.
+	A key that alerted within its rule's debounce window stays quiet even if
+	stock flaps back above and below the threshold.
+	"""
+	index = get_rule_index()
+	if not index:
+		return 0
+
+	cache = frappe.cache()
+	# The cache wrapper unpickles the values but leaves the hash keys as bytes
+	states = {
+		frappe.safe_decode(key): state for key, state in (cache.hgetall(ALERT_STATE_CACHE_KEY) or {}).items()
+	}
+	changed_states = {}
+	now = now_datetime()
+	alerts = {}
+
+	for row in changed_rows:
+		rules = index.get(row.get("item_code"))
+		if not rules:
+			continue
+
+		for rule in rules:
+			if rule.source_site and rule.source_site != site_name:
+				continue
+			if rule.warehouse and rule.warehouse != row.get("warehouse"):
+				continue
+
+			key = "|".join((rule.name, site_name, row.get("origin_site") or "", row.get("warehouse") or ""))
+			state = states.setdefault(key, {})
+			below = flt(row.get("available_qty")) < flt(rule.threshold)
+
+			if below and not state.get("below"):
+				last_notified = state.get("notified_at")
+				debounce_until = last_notified and add_to_date(
+					get_datetime(last_notified), minutes=cint(rule.debounce_minutes)
+				)
+
+				if not debounce_until or now >= debounce_until:
+					alerts.setdefault(rule.notify_user, []).append((rule, row))
+					state["notified_at"] = now.isoformat()
+
+			if below != state.get("below"):
+				state["below"] = below
+				changed_states[key] = state
+
+	for key, state in changed_states.items():
+		cache.hset(ALERT_STATE_CACHE_KEY, key, state)
+
+	for user, user_alerts in alerts.items():
+		send_alert_notification(user, site_name, user_alerts)
+
+	return sum(len(user_alerts) for user_alerts in alerts.values())
+
+
+def send_alert_notification(user, site_name, alerts):
+	"""
+	One Notification Log per user per sync, listing every item that crossed.
+	Item codes, warehouses and sites come from the partner, so they are escaped.
+	"""
+	lines = "".join(
+		f"<li>{escape_html(row.get('item_code'))} @ {escape_html(row.get('warehouse'))}"
+		f"{' (' + escape_html(row.get('origin_site')) + ')' if row.get('origin_site') else ''}: "
+		f"{flt(row.get('available_qty')):,.2f} available, threshold {flt(rule.threshold):,.2f}</li>"
+		for rule, row in alerts
+	)
+
+	frappe.get_doc(
+		{
+			"doctype": "Notification Log",
+			"for_user": user,
+			"type": "Alert",
+			"document_type": "Site Connection",
+			"document_name": site_name,
+			"subject": f"Low stock at {site_name}: {len(alerts)} item(s) below threshold",
+			"email_content": f"<ul>{lines}</ul>",
+		}
+	).insert(ignore_permissions=True)
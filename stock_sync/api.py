@@ -3,70 +3,65 @@ import frappe
 import requests
 import json
 from frappe import _
-from frappe.utils import now_datetime, get_datetime, cstr
+from frappe.utils import now_datetime, get_datetime, cstr, cint
 from requests.exceptions import RequestException, Timeout, SSLError, ConnectionError
 from urllib.parse import urljoin
+import time
 import traceback
 import urllib3
 
+from stock_sync import alerts, hub, item_metadata, snapshots
+from stock_sync.decoder import decode_stock_rows, log_rejects
+from stock_sync.profiling import bind_log, profiled
+from stock_sync.rate_limit import rate_limited
+from stock_sync.replica import replica_read
+from stock_sync.row_diff import (
+    BUCKET_PREFIX_LENGTH,
+    get_stored_snapshot,
+    diff_stock_rows,
+    apply_stock_diff,
+)
+from stock_sync.subscription import ensure_registered, get_subscription_joins, get_user_subscription
+
 @frappe.whitelist(allow_guest=False)
-def get_stock_for_external(warehouse=None, item_code=None):
+@rate_limited
+@profiled
+def get_stock_for_external(warehouse=None, item_code=None, item_bucket=None, snapshot=None):
     """
     API for OTHER sites to fetch THIS site's stock
     This should be on dashqube.com (which is working fine)
+    With `snapshot`, returns the version and download URL of the latest
+    prepared export file instead (see stock_sync.snapshots).
     """
     try:
         # Security check - ensure API key is provided
         auth_header = frappe.request.headers.get('Authorization', '')
         if not auth_header.startswith('token '):
             frappe.throw(_("Authentication required"), frappe.AuthenticationError)
-        
+
         warehouse = frappe.form_dict.get('warehouse')
         item_code = frappe.form_dict.get('item_code')
-        
-        filters = {}
-        where_clauses = ["bin.actual_qty > 0"]
-        
-        if warehouse:
-            where_clauses.append("bin.warehouse = %(warehouse)s")
-            filters["warehouse"] = warehouse
-        
-        if item_code:
-            where_clauses.append("bin.item_code = %(item_code)s")
-            filters["item_code"] = item_code
-        
-        where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
-        
+        item_bucket = frappe.form_dict.get('item_bucket')
+
+        if cint(frappe.form_dict.get('snapshot')):
+            return snapshots.get_snapshot_info(get_user_subscription())
+
         # Get stock data
-        stock_data = frappe.db.sql(f"""
-            SELECT 
-                bin.item_code,
-                item.item_name,
-                item.description,
-                bin.warehouse,
-                warehouse.warehouse_name,
-                bin.actual_qty,
-                bin.reserved_qty,
-                bin.ordered_qty,
-                (bin.actual_qty - bin.reserved_qty) as available_qty,
-                item.stock_uom,
-                NOW() as timestamp
-            FROM `tabBin` bin
-            LEFT JOIN `tabItem` item ON item.name = bin.item_code
-            LEFT JOIN `tabWarehouse` warehouse ON warehouse.name = bin.warehouse
-            WHERE {where_sql}
-            ORDER BY item.item_code, bin.warehouse
-        """, filters, as_dict=1)
-        
+        query_started = time.perf_counter()
+        stock_data = get_bin_stock(warehouse=warehouse, item_code=item_code, item_bucket=item_bucket,
+                                   subscription=get_user_subscription())
+        query_time_ms = round((time.perf_counter() - query_started) * 1000, 3)
+
         return {
             "success": True,
             "data": stock_data,
             "site": frappe.local.site,
             "timestamp": now_datetime().isoformat(),
             "count": len(stock_data),
+            "query_time_ms": query_time_ms,
             "message": f"Found {len(stock_data)} items"
         }
-        
+
     except frappe.AuthenticationError:
         frappe.log_error(
             title="Stock API Authentication Failed",
@@ -77,7 +72,7 @@ def get_stock_for_external(warehouse=None, item_code=None):
             "error": "Authentication failed",
             "status_code": 401
         }
-        
+
     except Exception as e:
         error_message = f"Stock Export API Error: {str(e)}"
         frappe.log_error(
@@ -90,83 +85,204 @@ def get_stock_for_external(warehouse=None, item_code=None):
             "status_code": 500
         }
 
+@replica_read
+def get_bin_stock(warehouse=None, item_code=None, updated_since=None, item_bucket=None, subscription=None):
+    """
+    THIS site's Bin stock in the shape partners consume.
+    With `updated_since`, returns Bins modified since then, including
+    zeroed ones, so incremental consumers see quantities drop to zero.
+    `item_bucket` limits it to one checksum bucket (see stock_sync.checksum).
+    `subscription` limits it to a partner's compiled Stock Subscription.
+    """
+    filters = {}
+    where_clauses = []
+
+    if updated_since:
+        where_clauses.append("bin.modified >= %(updated_since)s")
+        filters["updated_since"] = get_datetime(updated_since)
+    else:
+        where_clauses.append("bin.actual_qty > 0")
+
+    if warehouse:
+        where_clauses.append("bin.warehouse = %(warehouse)s")
+        filters["warehouse"] = warehouse
+
+    if item_code:
+        where_clauses.append("bin.item_code = %(item_code)s")
+        filters["item_code"] = item_code
+
+    if item_bucket:
+        where_clauses.append(f"LEFT(MD5(bin.item_code), {BUCKET_PREFIX_LENGTH}) = %(item_bucket)s")
+        filters["item_bucket"] = item_bucket
+
+    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+
+    subscription_joins, subscription_filters = get_subscription_joins(
+        subscription, "bin.item_code", "bin.warehouse")
+    filters.update(subscription_filters)
+
+    # Keys and quantities only; item metadata has its own channel (stock_sync.item_metadata)
+    return frappe.db.sql(f"""
+        SELECT 
+            bin.item_code,
+            bin.warehouse,
+            bin.actual_qty,
+            bin.reserved_qty,
+            bin.ordered_qty,
+            (bin.actual_qty - bin.reserved_qty) as available_qty
+        FROM `tabBin` bin
+        {subscription_joins}
+        WHERE {where_sql}
+        ORDER BY bin.item_code, bin.warehouse
+    """, filters, as_dict=1)
+
 @frappe.whitelist()
-def fetch_from_site(site_name, warehouse=None, item_code=None):
+@profiled
+def fetch_from_site(site_name, warehouse=None, item_code=None, full=False):
     """
     Fetch stock from partner site and store in External Stock View
     FIXED VERSION - Properly handles dashqube.com response format
     """
     log_doc = None
-    
+
     try:
         # Get site connection
         site = frappe.get_doc("Site Connection", site_name)
-        
+
         if not site.is_active:
             return {
                 "success": False,
                 "error": "Site connection is disabled",
                 "site": site_name
             }
-        
+
         # Create sync log
         log_doc = frappe.get_doc({
             "doctype": "Stock Sync Log",
             "site": site_name,
             "sync_date": now_datetime(),
-            "status": "Started"
+            "status": "Started",
+            "sync_type": "Sync"
         })
         log_doc.insert(ignore_permissions=True)
         frappe.db.commit()
-        
+        bind_log("fetch_from_site", log_doc.name)
+
         # Prepare request
         headers = {
             "Authorization": f"token {site.api_key}:{site.api_secret or ''}",
             "Accept": "application/json",
             "Content-Type": "application/json"
         }
-        
+
         params = {}
         if warehouse:
             params["warehouse"] = warehouse
         if item_code:
             params["item_code"] = item_code
-        
+
         endpoint = urljoin(site.site_url, "api/method/stock_sync.api.get_stock_for_external")
-        
+
+        # Hubs relay the whole fleet's stock and can be pulled incrementally
+        if site.is_hub:
+            endpoint = urljoin(site.site_url, hub.HUB_ENDPOINT)
+            params.update(hub.get_hub_params(site, full=cint(full)))
+
         # SSL verification
         verify_ssl = not site.get("disable_ssl_verification", False)
         timeout = site.get("timeout") or 45
-        
+
         if not verify_ssl:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
+
+        # Keep the source's copy of our subscription current
+        try:
+            ensure_registered(site)
+        except Exception:
+            frappe.log_error(
+                title="Stock Subscription Registration Error",
+                message=f"Error registering subscription with {site_name}:\n{traceback.format_exc()}"
+            )
+
         # Make API call
         log_doc.status = "Fetching"
         log_doc.save(ignore_permissions=True)
-        
-        response = requests.get(
-            endpoint,
-            headers=headers,
-            params=params,
-            timeout=timeout,
-            verify=verify_ssl
-        )
-        
+
+        # Full syncs from partners publishing snapshots download the prepared file instead
+        snapshot_version = snapshot_rows = response = None
+        if site.use_snapshots and not site.is_hub and not (warehouse or item_code):
+            try:
+                snapshot_version, snapshot_rows = snapshots.fetch_snapshot(site)
+            except Exception as e:
+                snapshot_version = None
+                if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 429:
+                    # Rate limited: skip this run like a rate-limited fetch, not fall back to a full export
+                    response = e.response
+                else:
+                    frappe.log_error(
+                        title="Stock Snapshot Download Error",
+                        message=f"Error downloading snapshot from {site_name}, falling back to a regular fetch:\n{traceback.format_exc()}"
+                    )
+
+        if snapshot_version and snapshot_rows is None:
+            # Same snapshot as last time: nothing changed
+            held_count = frappe.db.count("External Stock View", {"source_site": site_name})
+            log_doc.status = "Success"
+            log_doc.items_count = held_count
+            log_doc.unchanged_count = held_count
+            log_doc.response_data = json.dumps({"snapshot_version": snapshot_version, "unchanged": True})
+            log_doc.save(ignore_permissions=True)
+
+            # Item names and groups change without moving stock, so pull them anyway
+            try:
+                item_metadata.refresh_item_metadata(site)
+            except Exception:
+                frappe.log_error(
+                    title="Item Metadata Refresh Error",
+                    message=f"Error refreshing item metadata from {site_name}:\n{traceback.format_exc()}"
+                )
+
+            site.last_sync_time = now_datetime()
+            site.connection_status = "Connected"
+            site.save(ignore_permissions=True)
+            frappe.db.commit()
+
+            return {
+                "success": True,
+                "count": held_count,
+                "changes": {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": held_count},
+                "snapshot_version": snapshot_version,
+                "message": "Snapshot unchanged since the last sync",
+                "site": site_name
+            }
+
+        # Otherwise already downloaded, or rate limited; handled below like an API response
+        if not snapshot_version and response is None:
+            response = requests.get(
+                endpoint,
+                headers=headers,
+                params=params,
+                timeout=timeout,
+                verify=verify_ssl
+            )
+
         log_doc.status = "Processing"
         log_doc.save(ignore_permissions=True)
-        
+
         # Handle response - FIXED THIS PART
-        if response.status_code == 200:
+        if response is None or response.status_code == 200:
             try:
-                response_data = response.json()
-                
+                if response is None:
+                    response_data = {"message": {"success": True, "data": snapshot_rows}}
+                else:
+                    response_data = response.json()
+
                 # CRITICAL FIX: dashqube.com returns data in response.json()["message"]
                 # Check if data is in "message" field
                 if "message" in response_data:
                     # The actual API response is inside "message"
                     data = response_data["message"]
-                    
+
                     # Check if data has "success" field (some APIs nest it)
                     if isinstance(data, dict) and "success" in data:
                         # This is the format dashqube.com uses
@@ -179,10 +295,10 @@ def fetch_from_site(site_name, warehouse=None, item_code=None):
                             log_doc.error_message = error_msg
                             log_doc.response_data = json.dumps(data)
                             log_doc.save(ignore_permissions=True)
-                            
+
                             site.connection_status = "Failed"
                             site.save(ignore_permissions=True)
-                            
+
                             return {
                                 "success": False,
                                 "error": error_msg,
@@ -203,91 +319,126 @@ def fetch_from_site(site_name, warehouse=None, item_code=None):
                         log_doc.error_message = error_msg
                         log_doc.response_data = json.dumps(data)
                         log_doc.save(ignore_permissions=True)
-                        
+
                         site.connection_status = "Failed"
                         site.save(ignore_permissions=True)
-                        
+
                         return {
                             "success": False,
                             "error": error_msg,
                             "api_response": data,
                             "site": site_name
                         }
-                
-                # Clear old data for this site
-                frappe.db.sql("""
-                    DELETE FROM `tabExternal Stock View` 
-                    WHERE source_site = %s
-                """, site_name)
-                
-                # Insert new data
-                inserted_count = 0
-                for item in stock_data:
-                    try:
-                        external_stock = frappe.get_doc({
-                            "doctype": "External Stock View",
-                            "item_code": cstr(item.get("item_code")),
-                            "item_name": cstr(item.get("item_name", "")),
-                            "warehouse": cstr(item.get("warehouse", "")),
-                            "source_site": site_name,
-                            "actual_qty": float(item.get("actual_qty", 0)),
-                            "reserved_qty": float(item.get("reserved_qty", 0)),
-                            "ordered_qty": float(item.get("ordered_qty", 0)),
-                            "available_qty": float(item.get("available_qty", 0)),
-                            "stock_uom": cstr(item.get("stock_uom", "")),
-                            "last_sync": now_datetime()
-                        })
-                        external_stock.insert(ignore_permissions=True)
-                        inserted_count += 1
-                        
-                    except Exception as item_error:
-                        frappe.log_error(
-                            title="External Stock Insert Error",
-                            message=f"Failed to insert item {item.get('item_code')}: {str(item_error)}"
-                        )
-                        continue
-                
+
+                # Coerce incoming rows against the schema, collecting rejects
+                incoming_rows, rejects = decode_stock_rows(stock_data)
+
+                # Write only the rows that changed since the last sync
+                partial = bool(site.is_hub and isinstance(data, dict) and not data.get("full", True))
+                snapshot, duplicates = get_stored_snapshot(site_name, warehouse=warehouse, item_code=item_code)
+                diff = diff_stock_rows(incoming_rows, snapshot, duplicates, partial=partial)
+                changes = apply_stock_diff(site_name, diff, rejects)
+                log_rejects(site_name, rejects, len(stock_data), sync_log=log_doc.name)
+                synced_count = changes["inserted"] + changes["updated"] + changes["unchanged"]
+
+                # Item metadata is only pulled for Items modified since the last pull
+                try:
+                    item_metadata.refresh_item_metadata(site)
+                except Exception:
+                    frappe.log_error(
+                        title="Item Metadata Refresh Error",
+                        message=f"Error refreshing item metadata from {site_name}:\n{traceback.format_exc()}"
+                    )
+
                 frappe.db.commit()
-                
+
+                # Low-stock alerts only look at the rows this sync changed
+                try:
+                    alerts.evaluate_alerts(site_name, alerts.get_changed_rows(diff))
+                    frappe.db.commit()
+                except Exception:
+                    frappe.log_error(
+                        title="Stock Alert Evaluation Error",
+                        message=f"Error evaluating alerts for {site_name}:\n{traceback.format_exc()}"
+                    )
+
                 # Update log
                 log_doc.status = "Success"
-                log_doc.items_count = inserted_count
+                log_doc.items_count = synced_count
+                log_doc.inserted_count = changes["inserted"]
+                log_doc.updated_count = changes["updated"]
+                log_doc.deleted_count = changes["deleted"]
+                log_doc.unchanged_count = changes["unchanged"]
+                log_doc.rejected_count = rejects["total"]
                 log_doc.error_message = None
                 log_doc.response_data = json.dumps({
                     "received_count": len(stock_data),
-                    "inserted_count": inserted_count,
+                    "inserted_count": changes["inserted"],
+                    "updated_count": changes["updated"],
+                    "deleted_count": changes["deleted"],
+                    "unchanged_count": changes["unchanged"],
+                    "rejected_count": rejects["total"],
+                    "rejected_reasons": rejects["reasons"],
+                    "snapshot_version": snapshot_version,
                     "timestamp": data.get("timestamp") if isinstance(data, dict) else None
                 })
                 log_doc.save(ignore_permissions=True)
-                
+
                 # Update site status
                 site.last_sync_time = now_datetime()
                 site.connection_status = "Connected"
-                site.last_sync_count = inserted_count
+                site.last_sync_count = synced_count
+                if isinstance(data, dict) and data.get("site"):
+                    site.remote_site_name = data["site"]
+                if site.is_hub:
+                    site.hub_cursor = get_datetime(data.get("cursor")) if data.get("cursor") else None
+                    if not partial:
+                        site.last_full_sync = now_datetime()
+                if snapshot_version:
+                    site.snapshot_version = snapshot_version
                 site.save(ignore_permissions=True)
-                
+
                 return {
                     "success": True,
-                    "count": inserted_count,
+                    "count": synced_count,
                     "received": len(stock_data),
-                    "message": f"Successfully synchronized {inserted_count} items",
+                    "changes": changes,
+                    "rejected": rejects["total"],
+                    "message": f"Successfully synchronized {synced_count} items",
                     "site": site_name
                 }
-                
+
             except json.JSONDecodeError as e:
                 error_msg = f"Invalid JSON response: {str(e)}"
                 log_doc.status = "Failed"
                 log_doc.error_message = error_msg
                 log_doc.response_data = response.text[:1000] if response.text else ""
                 log_doc.save(ignore_permissions=True)
-                
+
                 return {
                     "success": False,
                     "error": error_msg,
                     "raw_response": response.text[:500],
                     "site": site_name
                 }
-                
+
+        elif response.status_code == 429:
+            # Rate limited by the partner: retry no sooner than it asks
+            retry_after = cint(response.headers.get("Retry-After")) or 60
+            error_msg = f"Rate limited by partner, retry after {retry_after} seconds"
+            log_doc.status = "Failed"
+            log_doc.error_message = error_msg
+            log_doc.save(ignore_permissions=True)
+
+            return {
+                "success": False,
+                "error": error_msg,
+                "type": "rate_limited",
+                "retry_after": retry_after,
+                "status_code": 429,
+                "site": site_name
+            }
+
         else:
             # HTTP error
             error_details = f"HTTP {response.status_code}"
@@ -299,57 +450,57 @@ def fetch_from_site(site_name, warehouse=None, item_code=None):
                     error_details += f": {error_data['exc']}"
             except:
                 error_details += f": {response.text[:500]}"
-            
+
             log_doc.status = "Failed"
             log_doc.error_message = error_details
             if response.text:
                 log_doc.response_data = response.text[:1000]
             log_doc.save(ignore_permissions=True)
-            
+
             site.connection_status = "Failed"
             site.save(ignore_permissions=True)
-            
+
             return {
                 "success": False,
                 "error": error_details,
                 "status_code": response.status_code,
                 "site": site_name
             }
-            
+
     except Timeout as e:
         error_msg = f"Request timeout after {timeout} seconds"
         if log_doc:
             log_doc.status = "Failed"
             log_doc.error_message = error_msg
             log_doc.save(ignore_permissions=True)
-        
+
         if 'site' in locals():
             site.connection_status = "Failed"
             site.save(ignore_permissions=True)
-        
+
         frappe.log_error(
             title="Stock Sync Timeout",
             message=f"Timeout fetching from {site_name}: {str(e)}"
         )
-        
+
         return {
             "success": False,
             "error": error_msg,
             "type": "timeout",
             "site": site_name
         }
-        
+
     except SSLError as e:
         error_msg = f"SSL Error: {str(e)}"
         if log_doc:
             log_doc.status = "Failed"
             log_doc.error_message = error_msg
             log_doc.save(ignore_permissions=True)
-        
+
         if 'site' in locals():
             site.connection_status = "Failed"
             site.save(ignore_permissions=True)
-        
+
         return {
             "success": False,
             "error": error_msg,
@@ -357,64 +508,64 @@ def fetch_from_site(site_name, warehouse=None, item_code=None):
             "suggestion": "Try enabling 'Disable SSL Verification' in site connection settings",
             "site": site_name
         }
-        
+
     except ConnectionError as e:
         error_msg = f"Connection Error: {str(e)}"
         if log_doc:
             log_doc.status = "Failed"
             log_doc.error_message = error_msg
             log_doc.save(ignore_permissions=True)
-        
+
         if 'site' in locals():
             site.connection_status = "Failed"
             site.save(ignore_permissions=True)
-        
+
         return {
             "success": False,
             "error": error_msg,
             "type": "connection_error",
             "site": site_name
         }
-        
+
     except RequestException as e:
         error_msg = f"Request Exception: {str(e)}"
         if log_doc:
             log_doc.status = "Failed"
             log_doc.error_message = error_msg
             log_doc.save(ignore_permissions=True)
-        
+
         if 'site' in locals():
             site.connection_status = "Failed"
             site.save(ignore_permissions=True)
-        
+
         frappe.log_error(
             title="Stock Sync Request Error",
             message=f"Error fetching from {site_name}: {str(e)}"
         )
-        
+
         return {
             "success": False,
             "error": error_msg,
             "type": "request_error",
             "site": site_name
         }
-        
+
     except Exception as e:
         error_msg = f"Unexpected error: {str(e)}"
         if log_doc:
             log_doc.status = "Failed"
             log_doc.error_message = error_msg
             log_doc.save(ignore_permissions=True)
-        
+
         if 'site' in locals():
             site.connection_status = "Failed"
             site.save(ignore_permissions=True)
-        
+
         frappe.log_error(
             title="Stock Sync Unexpected Error",
             message=f"Unexpected error fetching from {site_name}:\n{traceback.format_exc()}"
         )
-        
+
         return {
             "success": False,
             "error": error_msg,
@@ -423,28 +574,30 @@ def fetch_from_site(site_name, warehouse=None, item_code=None):
         }
 
 @frappe.whitelist()
+@profiled
 def fetch_all_sites(warehouse=None):
     """
     Fetch from all active sites
     """
     try:
-        active_sites = frappe.get_all("Site Connection",
+        # Spokes of a hub pull only from the hub, which relays every partner
+        active_sites = hub.get_active_hubs() or frappe.get_all("Site Connection",
                                      filters={"is_active": 1},
                                      fields=["name", "site_name"])
-        
+
         if not active_sites:
             return {
                 "success": False,
                 "error": "No active sites found"
             }
-        
+
         results = []
         successful = 0
         failed = 0
-        
+
         for site in active_sites:
             result = fetch_from_site(site.name, warehouse=warehouse)
-            
+
             results.append({
                 "site": site.site_name,
                 "site_name": site.name,
@@ -454,12 +607,12 @@ def fetch_all_sites(warehouse=None):
                 "error": result.get("error"),
                 "type": result.get("type")
             })
-            
+
             if result.get("success"):
                 successful += 1
             else:
                 failed += 1
-        
+
         return {
             "success": True,
             "results": results,
@@ -469,7 +622,7 @@ def fetch_all_sites(warehouse=None):
                 "failed": failed
             }
         }
-        
+
     except Exception as e:
         frappe.log_error(
             title="Bulk Sync Error",
@@ -0,0 +1,234 @@
+# stock_sync/checksum.py - checksum-tree drift detection between a partner's Bin and our copy
+#
+# Both sides hash their rows into a three-level tree:
+#   root -> warehouse -> item bucket (first hex digits of MD5(item_code)) -> rows
+# Reconciling compares the root, then warehouse hashes, then bucket hashes of the
+# warehouses that differ, and re-fetches only the buckets that differ.
+import hashlib
+import json
+import traceback
+
+import frappe
+from frappe import _
+from frappe.utils import cstr, flt, now_datetime
+
+from stock_sync import api
+from stock_sync.decoder import decode_stock_rows, log_rejects, new_rejects
+from stock_sync.partner import call_partner
+from stock_sync.row_diff import apply_stock_diff, diff_stock_rows, get_item_bucket, get_stored_snapshot
+from stock_sync.subscription import get_user_subscription
+
+CHECKSUM_ENDPOINT = "api/method/stock_sync.checksum.get_stock_checksums"
+STOCK_ENDPOINT = "api/method/stock_sync.api.get_stock_for_external"
+
+CHECKSUM_FIELDS = ("actual_qty", "reserved_qty", "ordered_qty", "available_qty")
+CHECKSUM_PRECISION = 6
+
+# Past this many differing buckets in one warehouse, re-fetch the whole warehouse
+MAX_BUCKET_FETCHES_PER_WAREHOUSE = 32
+
+
+def row_checksum(row):
+	values = [cstr(row.get("item_code")), cstr(row.get("warehouse"))]
+	values.extend(
+		f"{flt(row.get(field), CHECKSUM_PRECISION):.{CHECKSUM_PRECISION}f}" for field in CHECKSUM_FIELDS
+	)
+	return hashlib.sha1("|".join(values).encode()).hexdigest()
+
+
+def _combine(hashes):
+	return hashlib.sha1("".join(hashes).encode()).hexdigest()
+
+
+def build_checksum_tree(rows):
+	"""
+	{warehouse: {bucket: hash}} over rows, independent of row order
+	"""
+	leaves = {}
+	for row in rows:
+		warehouse = cstr(row.get("warehouse"))
+		bucket = get_item_bucket(row.get("item_code"))
+		leaves.setdefault(warehouse, {}).setdefault(bucket, []).append(row_checksum(row))
+
+	return {
+		warehouse: {bucket: _combine(sorted(hashes)) for bucket, hashes in buckets.items()}
+		for warehouse, buckets in leaves.items()
+	}
+
+
+def summarize_tree(tree):
+	"""
+	(root hash, {warehouse: hash}) of a checksum tree
+	"""
+	warehouses = {
+		warehouse: _combine(f"{bucket}:{digest}" for bucket, digest in sorted(buckets.items()))
+		for warehouse, buckets in tree.items()
+	}
+	root = _combine(f"{warehouse}:{digest}" for warehouse, digest in sorted(warehouses.items()))
+	return root, warehouses
+
+
+@frappe.whitelist(allow_guest=False)
+def get_stock_checksums(warehouses=None):
+	"""
+	API for OTHER sites to check their copy of THIS site's stock.
+	Without `warehouses`, returns the root and per-warehouse hashes;
+	with a JSON list of warehouses, returns their per-bucket hashes.
+	"""
+	try:
+		# Security check - ensure API key is provided
+		auth_header = frappe.request.headers.get("Authorization", "")
+		if not auth_header.startswith("token "):
+			frappe.throw(_("Authentication required"), frappe.AuthenticationError)
+
+		tree = build_checksum_tree(api.get_bin_stock(subscription=get_user_subscription()))
+
+		if warehouses:
+			if isinstance(warehouses, str):
+				warehouses = json.loads(warehouses)
+			return {
+				"success": True,
+				"buckets": {warehouse: tree.get(warehouse, {}) for warehouse in warehouses},
+			}
+
+		root, warehouse_hashes = summarize_tree(tree)
+		return {
+			"success": True,
+			"root": root,
+			"warehouses": warehouse_hashes,
+			"timestamp": now_datetime().isoformat(),
+		}
+
+	except frappe.AuthenticationError:
+		return {"success": False, "error": "Authentication failed", "status_code": 401}
+
+	except Exception as e:
+		error_message = f"Stock Checksum API Error: {e!s}"
+		frappe.log_error(
+			title="Stock Checksum API Error", message=f"{error_message}\n{traceback.format_exc()}"
+		)
+		return {"success": False, "error": error_message, "status_code": 500}
+
+
+def get_local_tree(site_name):
+	rows = frappe.db.sql(
+		"""
+        SELECT item_code, warehouse, actual_qty, reserved_qty, ordered_qty, available_qty
+        FROM `tabExternal Stock View`
+        WHERE source_site = %s AND IFNULL(origin_site, '') = ''
+    """,
+		site_name,
+		as_dict=1,
+	)
+	return build_checksum_tree(rows)
+
+
+def _diff_keys(remote, local):
+	return sorted(key for key in set(remote) | set(local) if remote.get(key) != local.get(key))
+
+
+@frappe.whitelist()
+def reconcile_site(site_name):
+	"""
+	Compare a partner's checksum tree with our copy and re-fetch only the
+	buckets that differ
+	"""
+	site = frappe.get_doc("Site Connection", site_name)
+	if not site.is_active:
+		return {"success": False, "error": "Site connection is disabled", "site": site_name}
+
+	if site.is_hub:
+		return {
+			"success": False,
+			"error": "Checksum reconcile is only supported for direct partners",
+			"site": site_name,
+		}
+
+	try:
+		remote = call_partner(site, CHECKSUM_ENDPOINT)
+		local_tree = get_local_tree(site_name)
+		local_root, local_warehouses = summarize_tree(local_tree)
+
+		if remote.get("root") == local_root:
+			return {"success": True, "in_sync": True, "site": site_name}
+
+		warehouses = _diff_keys(remote.get("warehouses") or {}, local_warehouses)
+		remote_buckets = (
+			call_partner(site, CHECKSUM_ENDPOINT, {"warehouses": json.dumps(warehouses)}).get("buckets") or {}
+		)
+
+		fetches = []
+		for warehouse in warehouses:
+			buckets = _diff_keys(remote_buckets.get(warehouse) or {}, local_tree.get(warehouse) or {})
+			if len(buckets) > MAX_BUCKET_FETCHES_PER_WAREHOUSE:
+				fetches.append((warehouse, None))
+			else:
+				fetches.extend((warehouse, bucket) for bucket in buckets)
+
+		log_doc = frappe.get_doc(
+			{
+				"doctype": "Stock Sync Log",
+				"site": site_name,
+				"sync_date": now_datetime(),
+				"status": "Processing",
+				"sync_type": "Reconcile",
+			}
+		).insert(ignore_permissions=True)
+
+		totals = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+		rejects = new_rejects()
+		received_count = 0
+		for warehouse, bucket in fetches:
+			params = {"warehouse": warehouse}
+			if bucket:
+				params["item_bucket"] = bucket
+
+			stock_data = call_partner(site, STOCK_ENDPOINT, params).get("data") or []
+			incoming_rows, rejects = decode_stock_rows(stock_data, rejects=rejects)
+			received_count += len(stock_data)
+
+			snapshot, duplicates = get_stored_snapshot(site_name, warehouse=warehouse, item_bucket=bucket)
+			changes = apply_stock_diff(
+				site_name, diff_stock_rows(incoming_rows, snapshot, duplicates), rejects
+			)
+			for key, count in changes.items():
+				totals[key] += count
+
+		# One summary for the whole reconcile, not one per bucket
+		log_rejects(site_name, rejects, received_count, sync_log=log_doc.name)
+		totals["rejected"] = rejects["total"]
+
+		log_doc.status = "Success"
+		log_doc.items_count = totals["inserted"] + totals["updated"] + totals["unchanged"]
+		log_doc.inserted_count = totals["inserted"]
+		log_doc.updated_count = totals["updated"]
+		log_doc.deleted_count = totals["deleted"]
+		log_doc.unchanged_count = totals["unchanged"]
+		log_doc.rejected_count = totals["rejected"]
+		log_doc.save(ignore_permissions=True)
+		frappe.db.commit()
+
+		return {
+			"success": True,
+			"in_sync": False,
+			"warehouses": len(warehouses),
+			"fetches": len(fetches),
+			"changes": totals,
+			"site": site_name,
+		}
+
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(
+			title="Stock Checksum Reconcile Error",
+			message=f"Error reconciling {site_name}:\n{traceback.format_exc()}",
+		)
+		return {"success": False, "error": str(e), "site": site_name}
+
+
+def reconcile_all_sites():
+	"""
+	Scheduled: reconcile every active direct partner
+	"""
+	for site in frappe.get_all("Site Connection", filters={"is_active": 1, "is_hub": 0}, pluck="name"):
+		reconcile_site(site)
@@ -0,0 +1,154 @@
+# stock_sync/commands.py - bench commands
+import json
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("stock-sync-load-test")
+@click.option("--url", help="Base URL of the site under test. Defaults to the site's host_name.")
+@click.option(
+	"--api-key",
+	help="API key to authenticate with. Defaults to a dedicated load-test user's keys, "
+	"which are exempt from stock_sync_rate_limits.",
+)
+@click.option("--api-secret", help="API secret to authenticate with.")
+@click.option("--seed-items", type=int, default=0, help="Seed this many test Items (with Bins) first.")
+@click.option("--seed-warehouses", type=int, default=10, help="Warehouses to spread seeded Bins over.")
+@click.option("--bins-per-item", type=int, default=3, help="Bins per seeded Item.")
+@click.option("--requests", "request_count", type=int, default=1000, help="Total requests to send.")
+@click.option("--clients", type=int, default=20, help="Concurrent clients.")
+@click.option("--timeout", type=int, default=60, help="Per-request timeout in seconds.")
+@click.option("--no-verify-ssl", is_flag=True, default=False)
+@click.option("--cleanup", is_flag=True, default=False, help="Delete seeded rows after the run.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Print the summary as JSON.")
+@pass_context
+def stock_sync_load_test(
+	context,
+	url=None,
+	api_key=None,
+	api_secret=None,
+	seed_items=0,
+	seed_warehouses=10,
+	bins_per_item=3,
+	request_count=1000,
+	clients=20,
+	timeout=60,
+	no_verify_ssl=False,
+	cleanup=False,
+	as_json=False,
+):
+	"""Load test get_stock_for_external with concurrent clients and mixed filters"""
+	import frappe
+
+	from stock_sync import load_test
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+
+	try:
+		if not (frappe.conf.allow_tests or frappe.conf.developer_mode):
+			click.secho(
+				"Refusing to run: enable allow_tests or developer_mode on a test site first", fg="red"
+			)
+			return
+
+		if seed_items:
+			click.echo(f"Seeding {seed_items} items x {bins_per_item} bins...")
+			load_test.seed(items=seed_items, warehouses=seed_warehouses, bins_per_item=bins_per_item)
+
+		if not api_key:
+			api_key, api_secret = load_test.get_load_test_keys()
+			if load_test.lift_rate_limits(api_key):
+				click.echo("Added the load-test user's key to stock_sync_rate_limits without limits")
+
+		url = url or frappe.utils.get_url()
+		item_codes, warehouses = load_test.get_seeded_keys()
+		plans = load_test.build_requests(request_count, item_codes, warehouses)
+
+		click.echo(f"Sending {request_count} requests to {url} from {clients} clients...")
+		summary = load_test.run(
+			url, api_key, api_secret, plans, clients=clients, timeout=timeout, verify_ssl=not no_verify_ssl
+		)
+
+		if as_json:
+			click.echo(json.dumps(summary, indent=2))
+		else:
+			_print_summary(summary)
+
+		if cleanup:
+			load_test.cleanup()
+
+	finally:
+		frappe.destroy()
+
+
+def _print_summary(summary):
+	click.echo(
+		f"\n{summary['requests']} requests in {summary['elapsed_s']}s "
+		f"({summary['requests_per_sec']} req/s), {summary['errors']} errors, "
+		f"{summary['rate_limited']} rate limited (left out of the latencies)"
+	)
+
+	header = f"{'filter':<22}{'reqs':>7}{'err':>6}{'429':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'db p50':>10}{'db p95':>10}{'rows':>9}"
+	click.echo(header)
+	click.echo("-" * len(header))
+
+	rows = [("all", summary), *summary["by_filter"].items()]
+	for name, stats in rows:
+		click.echo(
+			f"{name:<22}{stats['requests']:>7}{stats['errors']:>6}{stats['rate_limited']:>6}"
+			f"{_ms(stats['p50_ms'])}{_ms(stats['p95_ms'])}{_ms(stats['p99_ms'])}"
+			f"{_ms(stats['db_p50_ms'])}{_ms(stats['db_p95_ms'])}{stats['avg_rows']:>9}"
+		)
+
+
+def _ms(value):
+	return f"{'-' if value is None else f'{value:.1f}ms':>10}"
+
+
+@click.command("stock-sync-rebuild-rollup")
+@pass_context
+def stock_sync_rebuild_rollup(context):
+	"""Recompute External Stock Rollup from External Stock View"""
+	import frappe
+
+	from stock_sync import rollup
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+
+	try:
+		click.echo(f"Rebuilt rollup for {rollup.rebuild()} items")
+	finally:
+		frappe.destroy()
+
+
+@click.command("stock-sync-partition")
+@click.option("--disable", is_flag=True, default=False, help="Remove partitioning instead.")
+@pass_context
+def stock_sync_partition(context, disable=False):
+	"""Partition External Stock View by source site, or bring its partitions in line with Site Connections"""
+	import frappe
+
+	from stock_sync import partitioning
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+
+	try:
+		if disable:
+			partitioning.disable()
+			click.echo("Removed partitioning from External Stock View")
+		elif partitioning.is_partitioned():
+			click.echo(f"Synced partitions: {partitioning.sync_partitions()} changed")
+		else:
+			click.echo(f"Partitioned External Stock View for {partitioning.enable()} sites")
+	finally:
+		frappe.destroy()
+
+
+commands = [stock_sync_load_test, stock_sync_rebuild_rollup, stock_sync_partition]
@@ -0,0 +1,161 @@
+# stock_sync/decoder.py - schema-driven batch decoding of partner stock payloads
+import json
+import math
+
+import frappe
+
+# (fieldname, fieldtype, required, default)
+STOCK_ROW_SCHEMA = (
+	("item_code", "Data", True, None),
+	("warehouse", "Data", True, None),
+	("actual_qty", "Float", False, 0.0),
+	("reserved_qty", "Float", False, 0.0),
+	("ordered_qty", "Float", False, 0.0),
+	("available_qty", "Float", False, 0.0),
+	("origin_site", "Data", False, ""),
+)
+
+# Fields read from a differently named payload key: {fieldname: payload key}.
+# Hubs label each row with the site it belongs to as `source_site`.
+STOCK_ROW_SOURCE_KEYS = {
+	"origin_site": "source_site",
+}
+
+DECODE_BATCH_SIZE = 1000
+SAMPLES_PER_REASON = 5
+
+# Longest value a Data column holds (varchar(140))
+DATA_MAX_LENGTH = 140
+
+
+class RejectedValue(Exception):
+	def __init__(self, reason):
+		self.reason = reason
+
+
+def _coerce_text(value):
+	if isinstance(value, (dict, list)):
+		raise RejectedValue("not_text")
+	return str(value).strip()
+
+
+def _coerce_data(value):
+	value = _coerce_text(value)
+	if len(value) > DATA_MAX_LENGTH:
+		raise RejectedValue("too_long")
+	return value
+
+
+def _coerce_float(value):
+	if isinstance(value, bool):
+		raise RejectedValue("not_a_number")
+	try:
+		value = float(value)
+	except (TypeError, ValueError):
+		raise RejectedValue("not_a_number")
+	if not math.isfinite(value):
+		raise RejectedValue("not_finite")
+	return value
+
+
+COERCERS = {
+	"Data": _coerce_data,
+	"Text": _coerce_text,
+	"Float": _coerce_float,
+}
+
+
+def decode_stock_rows(
+	rows,
+	schema=STOCK_ROW_SCHEMA,
+	source_keys=STOCK_ROW_SOURCE_KEYS,
+	batch_size=DECODE_BATCH_SIZE,
+	rejects=None,
+):
+	"""
+	Coerce payload rows against `schema` a batch at a time, one column per pass.
+	Returns (decoded_rows, rejects) where `rejects` aggregates counts and sample
+	rows by reason instead of raising or logging per row. Pass `rejects` to
+	add to the rejects of earlier payloads of the same sync.
+	"""
+	decoded = []
+	if rejects is None:
+		rejects = new_rejects()
+
+	for start in range(0, len(rows), batch_size):
+		batch = rows[start : start + batch_size]
+		columns = {}
+		rejected = {}
+
+		for index, row in enumerate(batch):
+			if not isinstance(row, dict):
+				rejected[index] = "not_an_object"
+
+		for fieldname, fieldtype, required, default in schema:
+			coerce = COERCERS[fieldtype]
+			source_key = source_keys.get(fieldname, fieldname)
+			values = []
+			for index, row in enumerate(batch):
+				if index in rejected:
+					values.append(None)
+					continue
+
+				value = row.get(source_key)
+				if value is None or value == "":
+					if required:
+						rejected[index] = f"missing_{fieldname}"
+					values.append(default)
+					continue
+
+				try:
+					values.append(coerce(value))
+				except RejectedValue as e:
+					rejected[index] = f"{e.reason}:{fieldname}"
+					values.append(None)
+
+			columns[fieldname] = values
+
+		for index, row in enumerate(batch):
+			reason = rejected.get(index)
+			if reason:
+				add_reject(rejects, reason, row)
+				continue
+
+			decoded.append({fieldname: columns[fieldname][index] for fieldname, *_ in schema})
+
+	return decoded, rejects
+
+
+def new_rejects():
+	return {"total": 0, "reasons": {}, "samples": {}}
+
+
+def add_reject(rejects, reason, row):
+	rejects["total"] += 1
+	rejects["reasons"][reason] = rejects["reasons"].get(reason, 0) + 1
+
+	samples = rejects["samples"].setdefault(reason, [])
+	if len(samples) < SAMPLES_PER_REASON:
+		samples.append(row)
+
+
+def log_rejects(site_name, rejects, received_count, sync_log=None):
+	"""
+	Write a single Error Log entry summarizing every rejected row of a sync
+	"""
+	if not rejects["total"]:
+		return
+
+	summary = {
+		"site": site_name,
+		"sync_log": sync_log,
+		"received": received_count,
+		"rejected": rejects["total"],
+		"reasons": dict(sorted(rejects["reasons"].items(), key=lambda r: -r[1])),
+		"samples": rejects["samples"],
+	}
+
+	frappe.log_error(
+		title=f"Stock Sync: {rejects['total']} rows rejected from {site_name}",
+		message=json.dumps(summary, indent=2, default=str),
+	)
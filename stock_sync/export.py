@@ -0,0 +1,244 @@
+# stock_sync/export.py - bulk export of External Stock View for BI tools
+#
+# start_export queues a long job that streams the rows through a server-side cursor
+# into a private file; the client polls download_export, which serves the finished
+# file with send_file. No web worker is held while the export is read or written.
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import re
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import cint, get_datetime, now_datetime
+from werkzeug.utils import send_file
+
+from stock_sync.replica import use_replica
+from stock_sync.stock_sync.report.external_stock_view.external_stock_view import (
+	ITEM_METADATA_JOIN,
+	get_conditions,
+)
+
+EXPORT_FIELDS = [
+	"item_code",
+	"item_name",
+	"source_site",
+	"origin_site",
+	"warehouse",
+	"actual_qty",
+	"reserved_qty",
+	"ordered_qty",
+	"available_qty",
+	"last_sync",
+	"modified",
+]
+
+# Columns not read from External Stock View itself
+EXPORT_COLUMNS = {
+	"item_name": "meta.item_name",
+}
+
+EXPORT_FORMATS = {
+	"csv": "text/csv; charset=utf-8",
+	"ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+EXPORT_CACHE_KEY = "stock_sync:export"
+DOWNLOAD_ENDPOINT = "api/method/stock_sync.export.download_export"
+
+# Finished exports are kept this long for the client to download
+EXPORT_TTL = 24 * 60 * 60
+
+EXPORT_ID_PATTERN = re.compile(r"[0-9a-f]{20}")
+
+
+def get_export_dir(*parts):
+	return frappe.get_site_path("private", "stock_sync_exports", *parts)
+
+
+def get_export_path(export_id, format):
+	return get_export_dir(f"{export_id}.{format}")
+
+
+def get_export_state(export_id):
+	return frappe.cache().get_value(f"{EXPORT_CACHE_KEY}:{export_id}")
+
+
+def set_export_state(export_id, state):
+	frappe.cache().set_value(f"{EXPORT_CACHE_KEY}:{export_id}", state, expires_in_sec=EXPORT_TTL)
+
+
+@frappe.whitelist()
+def start_export(
+	format="csv",
+	source_site=None,
+	item_code=None,
+	warehouse=None,
+	last_sync_from=None,
+	last_sync_to=None,
+	show_only_available=None,
+	updated_since=None,
+	chunk_size=None,
+):
+	"""
+	Queue an export of External Stock View as CSV or NDJSON.
+	Filters match the External Stock View report; `updated_since` limits
+	the export to rows changed after the given datetime. Poll the returned
+	url until the file is ready.
+	"""
+	frappe.has_permission("External Stock View", "export", throw=True)
+
+	if format not in EXPORT_FORMATS:
+		frappe.throw(_("Unsupported export format: {0}").format(format))
+
+	filters = frappe._dict(
+		{
+			"source_site": source_site,
+			"item_code": item_code,
+			"warehouse": warehouse,
+			"last_sync_from": last_sync_from,
+			"last_sync_to": last_sync_to,
+			"show_only_available": cint(show_only_available),
+		}
+	)
+
+	conditions = get_conditions(filters)
+	if updated_since:
+		filters["updated_since"] = get_datetime(updated_since)
+		conditions += " AND esv.modified >= %(updated_since)s"
+
+	query = """
+        SELECT {fields}
+        FROM `tabExternal Stock View` esv
+        {item_metadata_join}
+        WHERE esv.docstatus = 0
+        {conditions}
+        ORDER BY esv.source_site, esv.item_code, esv.warehouse
+    """.format(
+		fields=", ".join(EXPORT_COLUMNS.get(field, f"esv.{field}") for field in EXPORT_FIELDS),
+		item_metadata_join=ITEM_METADATA_JOIN,
+		conditions=conditions,
+	)
+
+	export_id = frappe.generate_hash(length=20)
+	set_export_state(
+		export_id,
+		{
+			"status": "Queued",
+			"user": frappe.session.user,
+			"format": format,
+			"filename": f"external_stock_view_{now_datetime().strftime('%Y%m%d%H%M%S')}.{format}",
+		},
+	)
+	frappe.enqueue(
+		"stock_sync.export.write_export",
+		queue="long",
+		job_id=f"stock_sync:export:{export_id}",
+		export_id=export_id,
+		query=query,
+		filters=dict(filters),
+		format=format,
+		chunk_size=cint(chunk_size) or DEFAULT_CHUNK_SIZE,
+	)
+
+	return {
+		"export_id": export_id,
+		"status": "Queued",
+		"url": f"{DOWNLOAD_ENDPOINT}?export_id={export_id}",
+	}
+
+
+def write_export(export_id, query, filters, format, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""
+	Long queue: write the export to a private file, reading through an
+	unbuffered (server-side) cursor and writing chunk_size rows at a time
+	"""
+	state = get_export_state(export_id) or {}
+	set_export_state(export_id, {**state, "status": "Running"})
+
+	os.makedirs(get_export_dir(), exist_ok=True)
+	prune()
+
+	path = get_export_path(export_id, format)
+	tmp_path = f"{path}.tmp"
+	rows = 0
+	try:
+		with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+			buffer = io.StringIO()
+			writer = csv.writer(buffer) if format == "csv" else None
+			if writer:
+				writer.writerow(EXPORT_FIELDS)
+
+			with use_replica(), frappe.db.unbuffered_cursor():
+				for row in frappe.db.sql(query, filters, as_iterator=True):
+					if writer:
+						writer.writerow(row)
+					else:
+						buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row, strict=True)), default=str))
+						buffer.write("\n")
+
+					rows += 1
+					if rows % chunk_size == 0:
+						f.write(buffer.getvalue())
+						buffer.seek(0)
+						buffer.truncate()
+
+			f.write(buffer.getvalue())
+		os.replace(tmp_path, path)
+
+	except Exception:
+		with contextlib.suppress(FileNotFoundError):
+			os.remove(tmp_path)
+		set_export_state(export_id, {**state, "status": "Failed"})
+		frappe.log_error(title="External Stock Export Error", message=frappe.get_traceback())
+		raise
+
+	set_export_state(export_id, {**state, "status": "Ready", "rows": rows, "size": os.path.getsize(path)})
+
+
+def prune():
+	"""
+	Remove export files nobody can ask for any more
+	"""
+	expired = time.time() - EXPORT_TTL
+	for path in glob.glob(get_export_dir("*")):
+		if os.path.getmtime(path) < expired:
+			with contextlib.suppress(FileNotFoundError):
+				os.remove(path)
+
+
+@frappe.whitelist()
+def download_export(export_id):
+	"""
+	The finished export file, or the export's status while its job is still
+	running. Honours Range, so interrupted downloads can resume.
+	"""
+	frappe.has_permission("External Stock View", "export", throw=True)
+
+	state = get_export_state(export_id) if EXPORT_ID_PATTERN.fullmatch(export_id or "") else None
+	if not state or state.get("user") != frappe.session.user:
+		frappe.throw(_("Export {0} not found").format(export_id), frappe.DoesNotExistError)
+
+	if state["status"] != "Ready":
+		return {"export_id": export_id, "status": state["status"]}
+
+	path = get_export_path(export_id, state["format"])
+	if not os.path.exists(path):
+		frappe.throw(_("Export {0} is no longer available").format(export_id), frappe.DoesNotExistError)
+
+	# Served from the file by the WSGI file wrapper (sendfile where the server has it)
+	return send_file(
+		os.path.abspath(path),
+		frappe.request.environ,
+		mimetype=EXPORT_FORMATS[state["format"]],
+		as_attachment=True,
+		download_name=state["filename"],
+		conditional=True,
+		etag=export_id,
+	)
@@ -0,0 +1,170 @@
+# stock_sync/health.py - fleet-wide health probe for Site Connections
+import socket
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import frappe
+import requests
+import urllib3
+from frappe.utils import now_datetime
+from requests.exceptions import ConnectionError, RequestException, SSLError, Timeout
+
+HEALTH_CACHE_KEY = "stock_sync:site_health"
+PROBE_TIMEOUT = 5
+MAX_PROBE_WORKERS = 32
+
+
+@frappe.whitelist()
+def probe_all_sites():
+	"""
+	Probe every active Site Connection in parallel.
+	Results go to the cache; connection_status is only written when it changes.
+	"""
+	sites = frappe.get_all(
+		"Site Connection",
+		filters={"is_active": 1},
+		fields=[
+			"name",
+			"site_url",
+			"api_key",
+			"api_secret",
+			"disable_ssl_verification",
+			"timeout",
+			"connection_status",
+		],
+	)
+
+	if not sites:
+		return {"success": False, "error": "No active sites found"}
+
+	checked_at = now_datetime().isoformat()
+	with ThreadPoolExecutor(max_workers=min(len(sites), MAX_PROBE_WORKERS)) as executor:
+		results = list(executor.map(probe_site, sites))
+
+	changed = 0
+	cache = frappe.cache()
+	for site, result in zip(sites, results, strict=True):
+		result["checked_at"] = checked_at
+		cache.hset(HEALTH_CACHE_KEY, site.name, result)
+
+		if site.connection_status != result["status"]:
+			frappe.db.set_value(
+				"Site Connection", site.name, "connection_status", result["status"], update_modified=False
+			)
+			changed += 1
+
+	if changed:
+		frappe.db.commit()
+
+	return {
+		"success": True,
+		"results": results,
+		"summary": {
+			"total_sites": len(sites),
+			"connected": sum(1 for r in results if r["status"] == "Connected"),
+			"failed": sum(1 for r in results if r["status"] == "Failed"),
+			"status_changes": changed,
+		},
+	}
+
+
+@frappe.whitelist()
+def get_site_health(site_name=None):
+	"""
+	Return the last probe result for one site, or for all probed sites
+	"""
+	cache = frappe.cache()
+	if site_name:
+		return cache.hget(HEALTH_CACHE_KEY, site_name)
+
+	# hgetall leaves the hash keys (site names) as bytes
+	return {
+		frappe.safe_decode(key): result for key, result in (cache.hgetall(HEALTH_CACHE_KEY) or {}).items()
+	}
+
+
+def probe_site(site):
+	"""
+	Probe one site. Runs in a worker thread, so it must not touch frappe.db.
+	"""
+	result = {
+		"site": site.name,
+		"status": "Failed",
+		"http_status": None,
+		"latency_ms": None,
+		"tls_handshake_ms": None,
+		"error": None,
+		"type": None,
+	}
+
+	verify_ssl = not site.disable_ssl_verification
+	timeout = min(site.timeout or PROBE_TIMEOUT, PROBE_TIMEOUT)
+
+	try:
+		url = urlparse(site.site_url)
+		if url.scheme == "https":
+			result["tls_handshake_ms"] = measure_tls_handshake(
+				url.hostname, url.port or 443, timeout, verify_ssl
+			)
+
+		if not verify_ssl:
+			urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+		started = time.perf_counter()
+		response = requests.get(
+			urljoin(site.site_url, "api/method/frappe.auth.get_logged_user"),
+			headers={
+				"Authorization": f"token {site.api_key}:{site.api_secret or ''}",
+				"Accept": "application/json",
+			},
+			timeout=timeout,
+			verify=verify_ssl,
+		)
+		result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+		result["http_status"] = response.status_code
+
+		if response.status_code == 200 and response.json().get("message"):
+			result["status"] = "Connected"
+		else:
+			result["error"] = f"HTTP {response.status_code}"
+			result["type"] = "http_error"
+
+	except (Timeout, TimeoutError):
+		result["error"] = f"Probe timeout after {timeout} seconds"
+		result["type"] = "timeout"
+
+	except (SSLError, ssl.SSLError) as e:
+		result["error"] = f"SSL Error: {e!s}"
+		result["type"] = "ssl_error"
+
+	except ConnectionError as e:
+		result["error"] = f"Connection Error: {e!s}"
+		result["type"] = "connection_error"
+
+	except (RequestException, ValueError) as e:
+		result["error"] = f"Request Exception: {e!s}"
+		result["type"] = "request_error"
+
+	except OSError as e:
+		# Socket-level failures from the TLS handshake probe
+		result["error"] = f"Connection Error: {e!s}"
+		result["type"] = "connection_error"
+
+	return result
+
+
+def measure_tls_handshake(host, port, timeout, verify_ssl=True):
+	"""
+	Time a bare TLS handshake against host:port, in milliseconds
+	"""
+	context = ssl.create_default_context()
+	if not verify_ssl:
+		context.check_hostname = False
+		context.verify_mode = ssl.CERT_NONE
+
+	with socket.create_connection((host, port), timeout=timeout) as sock:
+		started = time.perf_counter()
+		with context.wrap_socket(sock, server_hostname=host):
+			return round((time.perf_counter() - started) * 1000, 1)
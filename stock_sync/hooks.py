@@ -148,6 +148,24 @@ app_license = "mit"
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+    "daily": [
+        "stock_sync.subscription.recompile_all"
+    ],
+    "hourly_long": [
+        "stock_sync.checksum.reconcile_all_sites"
+    ],
+    "cron": {
+        "* * * * *": [
+            "stock_sync.health.probe_all_sites",
+            "stock_sync.scheduler.run_due_syncs"
+        ],
+        "*/10 * * * *": [
+            "stock_sync.snapshots.enqueue_build_snapshots"
+        ]
+    }
+}
+
 website_route_rules = [
     {'from_route': '/api/method/stock_sync.<path:method>', 'to_route': 'stock_sync'}
 ]
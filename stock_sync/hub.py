@@ -0,0 +1,157 @@
+# stock_sync/hub.py - hub/relay mode
+# One hub site pulls from every partner and republishes the merged stock,
+# so spokes pull from the hub alone instead of from each other.
+import traceback
+
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+from stock_sync import api
+from stock_sync.partner import get_site_identity
+from stock_sync.rate_limit import rate_limited
+from stock_sync.replica import get_max_staleness
+
+HUB_ENDPOINT = "api/method/stock_sync.hub.get_hub_stock_for_external"
+
+# Spokes pull incrementally from the hub, and do a full pull (which also
+# removes rows the hub no longer holds) at least this often.
+FULL_SYNC_INTERVAL_HOURS = 6
+
+
+@frappe.whitelist(allow_guest=False)
+@rate_limited
+def get_hub_stock_for_external(warehouse=None, item_code=None, updated_since=None, exclude_site=None):
+	"""
+	API for spokes to fetch the merged stock of the whole fleet from THIS (hub) site.
+	Every row carries a `source_site` naming the site the stock belongs to.
+	With `updated_since`, only rows changed since then are returned.
+	"""
+	try:
+		# Security check - ensure API key is provided
+		auth_header = frappe.request.headers.get("Authorization", "")
+		if not auth_header.startswith("token "):
+			frappe.throw(_("Authentication required"), frappe.AuthenticationError)
+
+		# Taken before querying so rows changed mid-query are picked up next time,
+		# and moved back by the replica's lag so rows it hadn't applied yet are too
+		cursor = add_to_date(now_datetime(), seconds=-get_max_staleness())
+
+		stock_data = []
+		for row in api.get_bin_stock(warehouse=warehouse, item_code=item_code, updated_since=updated_since):
+			row["source_site"] = frappe.local.site
+			stock_data.append(row)
+
+		stock_data.extend(
+			get_relayed_stock(warehouse=warehouse, item_code=item_code, updated_since=updated_since)
+		)
+
+		if exclude_site:
+			stock_data = [row for row in stock_data if row["source_site"] != exclude_site]
+
+		return {
+			"success": True,
+			"data": stock_data,
+			"site": frappe.local.site,
+			"hub": True,
+			"full": not updated_since,
+			"cursor": cursor.isoformat(),
+			"timestamp": now_datetime().isoformat(),
+			"count": len(stock_data),
+			"message": f"Found {len(stock_data)} items",
+		}
+
+	except frappe.AuthenticationError:
+		frappe.log_error(
+			title="Stock API Authentication Failed", message="Authentication failed for hub stock API"
+		)
+		return {"success": False, "error": "Authentication failed", "status_code": 401}
+
+	except Exception as e:
+		error_message = f"Hub Stock Export API Error: {e!s}"
+		frappe.log_error(
+			title="Hub Stock Export API Error", message=f"{error_message}\n{traceback.format_exc()}"
+		)
+		return {"success": False, "error": error_message, "status_code": 500}
+
+
+def get_relayed_stock(warehouse=None, item_code=None, updated_since=None):
+	"""
+	Partner stock held in External Stock View, labelled with the partner's own site name.
+	Rows that reached this site through another hub keep their original site.
+	"""
+	conditions = ["esv.docstatus = 0"]
+	filters = {}
+
+	if warehouse:
+		conditions.append("esv.warehouse = %(warehouse)s")
+		filters["warehouse"] = warehouse
+
+	if item_code:
+		conditions.append("esv.item_code = %(item_code)s")
+		filters["item_code"] = item_code
+
+	if updated_since:
+		conditions.append("esv.modified >= %(updated_since)s")
+		filters["updated_since"] = get_datetime(updated_since)
+
+	rows = frappe.db.sql(
+		f"""
+        SELECT
+            esv.item_code,
+            esv.warehouse,
+            esv.actual_qty,
+            esv.reserved_qty,
+            esv.ordered_qty,
+            esv.available_qty,
+            esv.source_site AS connection,
+            esv.origin_site
+        FROM `tabExternal Stock View` esv
+        WHERE {" AND ".join(conditions)}
+        ORDER BY esv.source_site, esv.item_code, esv.warehouse
+    """,
+		filters,
+		as_dict=1,
+	)
+
+	identities = get_site_identities()
+	for row in rows:
+		row["source_site"] = row.pop("origin_site") or identities.get(row.connection) or row.connection
+		del row["connection"]
+
+	return rows
+
+
+def get_site_identities():
+	"""
+	{Site Connection name: the partner's fleet-wide identity}, the same name
+	it labels its own rows with
+	"""
+	return {
+		site.name: get_site_identity(site.remote_site_name, site.site_url)
+		for site in frappe.get_all("Site Connection", fields=["name", "site_url", "remote_site_name"])
+	}
+
+
+def get_hub_params(site, full=False):
+	"""
+	Request params for pulling from a hub Site Connection: incremental from
+	the stored cursor unless a full pull is asked for or due.
+	"""
+	params = {"exclude_site": frappe.local.site}
+
+	full_due = (
+		not site.hub_cursor
+		or not site.last_full_sync
+		or get_datetime(site.last_full_sync) < add_to_date(now_datetime(), hours=-FULL_SYNC_INTERVAL_HOURS)
+	)
+	if not full and not full_due:
+		params["updated_since"] = str(site.hub_cursor)
+
+	return params
+
+
+def get_active_hubs():
+	return frappe.get_all(
+		"Site Connection", filters={"is_active": 1, "is_hub": 1}, fields=["name", "site_name"]
+	)
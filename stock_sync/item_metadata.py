@@ -0,0 +1,195 @@
+# stock_sync/item_metadata.py - versioned item metadata channel
+# Stock rows carry only keys and quantities; item names, descriptions and UOMs
+# travel here, and only for Items modified or first stocked since the consumer's last pull.
+import traceback
+
+import frappe
+from frappe import _
+from frappe.utils import get_datetime, now_datetime
+
+from stock_sync.decoder import decode_stock_rows, log_rejects
+from stock_sync.partner import call_partner, get_site_identity
+from stock_sync.subscription import get_subscription_joins, get_user_subscription
+
+METADATA_ENDPOINT = "api/method/stock_sync.item_metadata.get_item_metadata_for_external"
+
+# (fieldname, fieldtype, required, default), as in stock_sync.decoder
+ITEM_METADATA_SCHEMA = (
+	("item_code", "Data", True, None),
+	("item_name", "Data", False, ""),
+	("description", "Text", False, ""),
+	("stock_uom", "Data", False, ""),
+	("origin_site", "Data", False, ""),
+)
+
+METADATA_FIELDS = ("item_name", "description", "stock_uom")
+
+
+@frappe.whitelist(allow_guest=False)
+def get_item_metadata_for_external(modified_since=None, relay=None):
+	"""
+	API for OTHER sites to fetch metadata of THIS site's stocked Items.
+	With `modified_since`, only Items modified, or first stocked, since then are returned.
+	With `relay`, metadata held for partners is included too (hub mode),
+	each row labelled with the `source_site` it belongs to.
+	"""
+	try:
+		# Security check - ensure API key is provided
+		auth_header = frappe.request.headers.get("Authorization", "")
+		if not auth_header.startswith("token "):
+			frappe.throw(_("Authentication required"), frappe.AuthenticationError)
+
+		# Taken before querying so Items changed mid-query are picked up next time
+		version = now_datetime()
+		filters = {}
+		condition = ""
+		if modified_since:
+			filters["modified_since"] = get_datetime(modified_since)
+			# Items stocked since then are new to the consumer even if unchanged themselves
+			condition = """
+                AND (item.modified >= %(modified_since)s
+                    OR EXISTS (SELECT 1 FROM `tabBin` new_bin
+                        WHERE new_bin.item_code = item.name AND new_bin.creation >= %(modified_since)s))
+            """
+
+		subscription_joins, subscription_filters = get_subscription_joins(
+			get_user_subscription(), "item.name"
+		)
+		filters.update(subscription_filters)
+
+		items = frappe.db.sql(
+			f"""
+            SELECT
+                item.name AS item_code,
+                item.item_name,
+                item.description,
+                item.stock_uom
+            FROM `tabItem` item
+            {subscription_joins}
+            WHERE EXISTS (SELECT 1 FROM `tabBin` bin WHERE bin.item_code = item.name)
+            {condition}
+        """,
+			filters,
+			as_dict=1,
+		)
+
+		for item in items:
+			item["source_site"] = frappe.local.site
+
+		if relay:
+			items.extend(get_relayed_item_metadata(modified_since))
+
+		return {"success": True, "data": items, "version": version.isoformat(), "count": len(items)}
+
+	except frappe.AuthenticationError:
+		return {"success": False, "error": "Authentication failed", "status_code": 401}
+
+	except Exception as e:
+		error_message = f"Item Metadata API Error: {e!s}"
+		frappe.log_error(
+			title="Item Metadata API Error", message=f"{error_message}\n{traceback.format_exc()}"
+		)
+		return {"success": False, "error": error_message, "status_code": 500}
+
+
+def get_relayed_item_metadata(modified_since=None):
+	filters = {}
+	condition = ""
+	if modified_since:
+		filters["modified_since"] = get_datetime(modified_since)
+		condition = "WHERE meta.modified >= %(modified_since)s"
+
+	rows = frappe.db.sql(
+		f"""
+        SELECT meta.item_code, meta.item_name, meta.description, meta.stock_uom,
+            meta.origin_site, site.site_url, site.remote_site_name
+        FROM `tabExternal Item Metadata` meta
+        LEFT JOIN `tabSite Connection` site ON site.name = meta.source_site
+        {condition}
+    """,
+		filters,
+		as_dict=1,
+	)
+
+	for row in rows:
+		row["source_site"] = row.pop("origin_site") or get_site_identity(
+			row.pop("remote_site_name"), row.pop("site_url")
+		)
+
+	return rows
+
+
+def refresh_item_metadata(site):
+	"""
+	Pull metadata of Items modified since the last pull from a partner into
+	External Item Metadata. Returns the number of Items written.
+	"""
+	params = {}
+	if site.item_metadata_version:
+		params["modified_since"] = str(site.item_metadata_version)
+	if site.is_hub:
+		params["relay"] = 1
+
+	response = call_partner(site, METADATA_ENDPOINT, params)
+	rows = response.get("data") or []
+
+	# Direct partners' rows belong to the partner itself; relayed rows keep their origin
+	if not site.is_hub:
+		for row in rows:
+			row.pop("source_site", None)
+
+	items, rejects = decode_stock_rows(rows, schema=ITEM_METADATA_SCHEMA)
+	log_rejects(site.name, rejects, len(rows))
+	written = upsert_item_metadata(site.name, items)
+
+	frappe.db.set_value(
+		"Site Connection",
+		site.name,
+		"item_metadata_version",
+		get_datetime(response.get("version")),
+		update_modified=False,
+	)
+	site.item_metadata_version = response.get("version")
+
+	return written
+
+
+def upsert_item_metadata(site_name, items):
+	if not items:
+		return 0
+
+	existing = {
+		(row.origin_site or "", row.item_code): row
+		for row in frappe.get_all(
+			"External Item Metadata",
+			filters={
+				"source_site": site_name,
+				"item_code": ("in", list({item["item_code"] for item in items})),
+			},
+			fields=["name", "origin_site", "item_code", *METADATA_FIELDS],
+		)
+	}
+
+	written = 0
+	for item in items:
+		stored = existing.get((item["origin_site"], item["item_code"]))
+		values = {field: item[field] for field in METADATA_FIELDS}
+
+		if not stored:
+			doc = frappe.get_doc(
+				{
+					"doctype": "External Item Metadata",
+					"source_site": site_name,
+					"origin_site": item["origin_site"],
+					"item_code": item["item_code"],
+					**values,
+				}
+			).insert(ignore_permissions=True)
+			existing[(item["origin_site"], item["item_code"])] = frappe._dict(values, name=doc.name)
+			written += 1
+
+		elif any((stored.get(field) or "") != values[field] for field in METADATA_FIELDS):
+			frappe.db.set_value("External Item Metadata", stored.name, values)
+			written += 1
+
+	return written
@@ -0,0 +1,231 @@
+# stock_sync/load_test.py - load test for the get_stock_for_external endpoint
+# Only meant for test sites: seeding writes Item, Warehouse and Bin rows directly.
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import frappe
+import requests
+from frappe.utils import now_datetime
+
+SEED_PREFIX = "SSLT-"
+STOCK_ENDPOINT = "api/method/stock_sync.api.get_stock_for_external"
+
+# Requests authenticate as this user, so a run never rotates a real user's keys
+LOAD_TEST_USER = "stock-sync-load-test@example.com"
+
+# stock_sync_rate_limits entry for the load-test user's key, so a run measures the
+# endpoint rather than the rate limiter in front of it
+LOAD_TEST_LIMITS = {"rate_per_minute": 1000000, "burst": 1000000, "max_concurrent": 0}
+
+# (filter mix name, weight)
+FILTER_MIX = (
+	("none", 1),
+	("warehouse", 4),
+	("item_code", 4),
+	("warehouse+item_code", 1),
+)
+
+SEED_BATCH_SIZE = 1000
+
+
+def seed(items=1000, warehouses=10, bins_per_item=3):
+	"""
+	Insert SSLT- prefixed Items and Warehouses, and Bins for each item in
+	`bins_per_item` random warehouses. Returns (item codes, warehouse names).
+	"""
+	now = now_datetime()
+	common = {"creation": now, "modified": now, "owner": "Administrator", "modified_by": "Administrator"}
+
+	warehouse_names = [f"{SEED_PREFIX}WH-{i:04d}" for i in range(warehouses)]
+	_bulk_insert("Warehouse", [{"name": name, "warehouse_name": name, **common} for name in warehouse_names])
+
+	item_codes = [f"{SEED_PREFIX}ITEM-{i:07d}" for i in range(items)]
+	_bulk_insert(
+		"Item",
+		[
+			{
+				"name": code,
+				"item_code": code,
+				"item_name": f"Load Test {code}",
+				"stock_uom": "Nos",
+				"is_stock_item": 1,
+				**common,
+			}
+			for code in item_codes
+		],
+	)
+
+	bins = []
+	for code in item_codes:
+		for warehouse in random.sample(warehouse_names, min(bins_per_item, warehouses)):
+			actual = random.randint(1, 500)
+			bins.append(
+				{
+					"name": frappe.generate_hash(length=12),
+					"item_code": code,
+					"warehouse": warehouse,
+					"actual_qty": actual,
+					"reserved_qty": random.randint(0, actual),
+					"ordered_qty": random.randint(0, 100),
+					**common,
+				}
+			)
+	_bulk_insert("Bin", bins)
+
+	frappe.db.commit()
+	return item_codes, warehouse_names
+
+
+def _bulk_insert(doctype, rows):
+	if not rows:
+		return
+	fields = list(rows[0])
+	frappe.db.bulk_insert(
+		doctype,
+		fields,
+		[tuple(row[f] for f in fields) for row in rows],
+		chunk_size=SEED_BATCH_SIZE,
+		ignore_duplicates=True,
+	)
+
+
+def cleanup():
+	for doctype, field in (("Bin", "item_code"), ("Item", "name"), ("Warehouse", "name")):
+		frappe.db.delete(doctype, {field: ("like", f"{SEED_PREFIX}%")})
+	frappe.db.commit()
+
+
+def get_load_test_keys():
+	"""
+	(api_key, api_secret) of the load-test user, created on first use
+	"""
+	from frappe.core.doctype.user.user import generate_keys
+
+	if not frappe.db.exists("User", LOAD_TEST_USER):
+		frappe.get_doc(
+			{
+				"doctype": "User",
+				"email": LOAD_TEST_USER,
+				"first_name": "Stock Sync Load Test",
+				"send_welcome_email": 0,
+			}
+		).insert(ignore_permissions=True)
+
+	api_secret = generate_keys(LOAD_TEST_USER)["api_secret"]
+	frappe.db.commit()
+	return frappe.db.get_value("User", LOAD_TEST_USER, "api_key"), api_secret
+
+
+def lift_rate_limits(api_key):
+	"""
+	Give `api_key` its own entry in stock_sync_rate_limits, unless it already has one
+	"""
+	from frappe.installer import update_site_config
+
+	rate_limits = frappe.conf.get("stock_sync_rate_limits") or {}
+	if api_key in rate_limits:
+		return False
+
+	update_site_config("stock_sync_rate_limits", {**rate_limits, api_key: LOAD_TEST_LIMITS})
+	return True
+
+
+def get_seeded_keys():
+	item_codes = frappe.get_all("Item", filters={"name": ("like", f"{SEED_PREFIX}%")}, pluck="name")
+	warehouses = frappe.get_all("Warehouse", filters={"name": ("like", f"{SEED_PREFIX}%")}, pluck="name")
+	return item_codes, warehouses
+
+
+def build_requests(count, item_codes, warehouses):
+	"""
+	`count` param dicts drawn from FILTER_MIX
+	"""
+	mixes = random.choices([m for m, w in FILTER_MIX], weights=[w for m, w in FILTER_MIX], k=count)
+	plans = []
+	for mix in mixes:
+		params = {}
+		if "warehouse" in mix and warehouses:
+			params["warehouse"] = random.choice(warehouses)
+		if "item_code" in mix and item_codes:
+			params["item_code"] = random.choice(item_codes)
+		plans.append((mix, params))
+	return plans
+
+
+def run(url, api_key, api_secret, plans, clients=20, timeout=60, verify_ssl=True):
+	"""
+	Send every planned request from `clients` concurrent sessions.
+	Each client keeps its own keep-alive session, like a partner would.
+	"""
+	endpoint = urljoin(url if url.endswith("/") else url + "/", STOCK_ENDPOINT)
+	headers = {"Authorization": f"token {api_key}:{api_secret}", "Accept": "application/json"}
+	local = threading.local()
+
+	def send(plan):
+		mix, params = plan
+		session = getattr(local, "session", None)
+		if session is None:
+			session = local.session = requests.Session()
+			session.headers.update(headers)
+
+		started = time.perf_counter()
+		result = {"mix": mix, "ok": False, "status": None, "query_time_ms": None, "rows": 0}
+		try:
+			response = session.get(endpoint, params=params, timeout=timeout, verify=verify_ssl)
+			result["status"] = response.status_code
+			message = response.json().get("message") or {}
+			result["ok"] = response.status_code == 200 and bool(message.get("success"))
+			result["query_time_ms"] = message.get("query_time_ms")
+			result["rows"] = message.get("count") or 0
+		except Exception as e:
+			result["error"] = str(e)
+		result["latency_ms"] = (time.perf_counter() - started) * 1000
+		return result
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=clients) as executor:
+		results = list(executor.map(send, plans))
+	elapsed = time.perf_counter() - started
+
+	return summarize(results, elapsed)
+
+
+def percentile(values, pct):
+	if not values:
+		return None
+	values = sorted(values)
+	index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+	return round(values[index], 2)
+
+
+def summarize(results, elapsed):
+	def stats(subset):
+		# A 429 is answered before the export runs, so it would only flatter the latencies
+		served = [r for r in subset if r["status"] != 429]
+		latencies = [r["latency_ms"] for r in served]
+		db_times = [r["query_time_ms"] for r in served if r["query_time_ms"] is not None]
+		return {
+			"requests": len(subset),
+			"rate_limited": len(subset) - len(served),
+			"errors": sum(1 for r in served if not r["ok"]),
+			"p50_ms": percentile(latencies, 50),
+			"p95_ms": percentile(latencies, 95),
+			"p99_ms": percentile(latencies, 99),
+			"max_ms": round(max(latencies), 2) if latencies else None,
+			"db_p50_ms": percentile(db_times, 50),
+			"db_p95_ms": percentile(db_times, 95),
+			"avg_rows": round(sum(r["rows"] for r in subset) / len(subset), 1) if subset else 0,
+		}
+
+	summary = stats(results)
+	summary["elapsed_s"] = round(elapsed, 2)
+	summary["requests_per_sec"] = round(len(results) / elapsed, 2) if elapsed else None
+	summary["by_filter"] = {
+		mix: stats([r for r in results if r["mix"] == mix])
+		for mix, weight in FILTER_MIX
+		if any(r["mix"] == mix for r in results)
+	}
+	return summary
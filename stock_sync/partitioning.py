@@ -0,0 +1,235 @@
+# stock_sync/partitioning.py - LIST partitioning of External Stock View by source_site
+#
+# Each Site Connection gets its own partition, and rows of any other site land in the
+# DEFAULT partition. A site's rows can then be cleared with TRUNCATE PARTITION instead
+# of a DELETE, and site-filtered queries read one partition. MariaDB requires the
+# partitioning column in every unique key, so partitioning makes the primary key
+# (name, source_site).
+#
+# Partition DDL commits the open transaction, so none of this runs inside a sync.
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils.background_jobs import is_job_enqueued
+
+from stock_sync import report_cache, rollup, scheduler
+
+TABLE = "tabExternal Stock View"
+DEFAULT_PARTITION = "p_default"
+
+# Site Connection fields that let a sync skip rows it already holds
+SYNC_CURSOR_FIELDS = ("snapshot_version", "hub_cursor", "last_full_sync", "item_metadata_version")
+
+
+def get_partition_name(site_name):
+	return "p_" + hashlib.md5(site_name.encode()).hexdigest()[:16]
+
+
+def get_partitions():
+	"""
+	{partition name: LIST values expression} of the table, empty when not partitioned
+	"""
+	return {
+		row.name: row.expression
+		for row in frappe.db.sql(
+			"""
+            SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS expression
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        """,
+			TABLE,
+			as_dict=1,
+		)
+	}
+
+
+def is_partitioned():
+	return bool(get_partitions())
+
+
+def _partition_definition(site_name):
+	return f"PARTITION `{get_partition_name(site_name)}` VALUES IN ({frappe.db.escape(site_name)})"
+
+
+def enable():
+	"""
+	Partition the table by source_site, one partition per Site Connection
+	"""
+	if is_partitioned():
+		return sync_partitions()
+
+	sites = frappe.get_all("Site Connection", pluck="name", order_by="name")
+	definitions = [_partition_definition(site) for site in sites]
+	definitions.append(f"PARTITION `{DEFAULT_PARTITION}` DEFAULT")
+
+	frappe.db.sql(f"UPDATE `{TABLE}` SET source_site = '' WHERE source_site IS NULL")
+	frappe.db.sql_ddl(f"""
+        ALTER TABLE `{TABLE}`
+            MODIFY source_site VARCHAR(140) NOT NULL,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (name, source_site)
+    """)
+	frappe.db.sql_ddl(f"""
+        ALTER TABLE `{TABLE}`
+        PARTITION BY LIST COLUMNS (source_site) (
+            {", ".join(definitions)}
+        )
+    """)
+
+	return len(sites)
+
+
+def disable():
+	if not is_partitioned():
+		return
+
+	frappe.db.sql_ddl(f"ALTER TABLE `{TABLE}` REMOVE PARTITIONING")
+	frappe.db.sql_ddl(f"""
+        ALTER TABLE `{TABLE}`
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (name),
+            MODIFY source_site VARCHAR(140) NULL DEFAULT NULL
+    """)
+
+
+def add_partition(site_name):
+	"""
+	Give a site its own partition, moving any of its rows out of the DEFAULT partition
+	"""
+	partitions = get_partitions()
+	if not partitions or get_partition_name(site_name) in partitions:
+		return False
+
+	frappe.db.sql_ddl(f"""
+        ALTER TABLE `{TABLE}`
+        REORGANIZE PARTITION `{DEFAULT_PARTITION}` INTO (
+            {_partition_definition(site_name)},
+            PARTITION `{DEFAULT_PARTITION}` DEFAULT
+        )
+    """)
+	return True
+
+
+def drop_partition(site_name):
+	"""
+	Drop a removed site's partition, and the rows in it
+	"""
+	partitions = get_partitions()
+	if get_partition_name(site_name) not in partitions:
+		return False
+
+	_remove_from_rollup(site_name)
+	frappe.db.sql_ddl(f"ALTER TABLE `{TABLE}` DROP PARTITION `{get_partition_name(site_name)}`")
+	report_cache.invalidate(site_name)
+	return True
+
+
+def sync_partitions():
+	"""
+	Add partitions for Site Connections that don't have one, and drop those of
+	sites that no longer exist. Returns the number of partitions changed.
+	"""
+	partitions = get_partitions()
+	if not partitions:
+		return 0
+
+	sites = set(frappe.get_all("Site Connection", pluck="name"))
+	expected = {get_partition_name(site): site for site in sites}
+	changed = 0
+
+	for site in sorted(sites):
+		changed += add_partition(site)
+
+	for partition, expression in partitions.items():
+		if partition != DEFAULT_PARTITION and partition not in expected:
+			# VALUES IN ('site') as stored by MariaDB
+			site_name = expression.strip("'") if expression else None
+			if site_name:
+				_remove_from_rollup(site_name)
+				report_cache.invalidate(site_name)
+			frappe.db.sql_ddl(f"ALTER TABLE `{TABLE}` DROP PARTITION `{partition}`")
+			changed += 1
+
+	return changed
+
+
+def enqueue_clear_site_stock(site_name):
+	"""
+	Queue clear_site_stock under the site's sync job id, so the scheduler
+	enqueues no sync of the site until it has finished
+	"""
+	job_id = scheduler.get_job_id(site_name)
+	if is_job_enqueued(job_id):
+		frappe.throw(
+			_("A sync of {0} is queued or running. Try again once it has finished.").format(site_name)
+		)
+
+	frappe.enqueue(
+		"stock_sync.partitioning.clear_site_stock",
+		queue="long",
+		job_id=job_id,
+		deduplicate=True,
+		site_name=site_name,
+	)
+
+
+def clear_site_stock(site_name):
+	"""
+	Remove every row held for a site: TRUNCATE PARTITION when the site has one,
+	a DELETE otherwise. The site's sync cursors are reset with them, so its next
+	sync fetches everything again. Returns the number of rows removed.
+	"""
+	partitioned = get_partition_name(site_name) in get_partitions()
+
+	# Read right before the rows go, so the rollup loses exactly what is removed
+	totals = get_site_totals(site_name)
+	if totals:
+		rollup.remove_site(site_name, totals)
+	frappe.db.set_value(
+		"Site Connection", site_name, dict.fromkeys(SYNC_CURSOR_FIELDS), update_modified=False
+	)
+
+	if partitioned:
+		try:
+			# sql_ddl commits the rollup and cursor changes first, then runs the TRUNCATE
+			frappe.db.sql_ddl(f"ALTER TABLE `{TABLE}` TRUNCATE PARTITION `{get_partition_name(site_name)}`")
+		except Exception:
+			# The rows are still there: put them back in the rollup. The reset cursors
+			# only make the next sync a full one.
+			frappe.db.rollback()
+			rollup.rebuild_items([row.item_code for row in totals])
+			frappe.db.commit()
+			raise
+	else:
+		frappe.db.delete("External Stock View", {"source_site": site_name})
+
+	frappe.db.commit()
+	report_cache.invalidate(site_name)
+	return sum(row.row_count for row in totals)
+
+
+def get_site_totals(site_name):
+	"""
+	A site's summed quantities and row count per (item_code, origin_site)
+	"""
+	return frappe.db.sql(
+		f"""
+        SELECT item_code, IFNULL(origin_site, '') AS origin_site, COUNT(*) AS row_count,
+            {", ".join(f"SUM({field}) AS {field}" for field in rollup.ROLLUP_FIELDS)}
+        FROM `{TABLE}`
+        WHERE source_site = %s
+        GROUP BY item_code, IFNULL(origin_site, '')
+    """,
+		site_name,
+		as_dict=1,
+	)
+
+
+def _remove_from_rollup(site_name):
+	"""
+	Take a site's rows out of the per-item rollup before they are removed in bulk
+	"""
+	totals = get_site_totals(site_name)
+	if totals:
+		rollup.remove_site(site_name, totals)
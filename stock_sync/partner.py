@@ -0,0 +1,46 @@
+# stock_sync/partner.py - calling whitelisted methods on partner sites
+from urllib.parse import urljoin, urlparse
+
+import frappe
+import requests
+import urllib3
+from frappe import _
+
+
+def get_site_identity(remote_site_name, site_url):
+	"""
+	The name a partner's stock goes by across the fleet: the site name it
+	reports for itself, or its host until it has reported one
+	"""
+	return remote_site_name or urlparse(site_url or "").hostname
+
+
+def call_partner(site, endpoint, params=None, data=None):
+	"""
+	Call a partner's whitelisted method and return its unwrapped response.
+	Sent as a GET, or as a JSON POST when `data` is given.
+	"""
+	verify_ssl = not site.get("disable_ssl_verification", False)
+	if not verify_ssl:
+		urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+	response = requests.request(
+		"POST" if data is not None else "GET",
+		urljoin(site.site_url, endpoint),
+		headers={
+			"Authorization": f"token {site.api_key}:{site.api_secret or ''}",
+			"Accept": "application/json",
+		},
+		params=params or {},
+		json=data,
+		timeout=site.get("timeout") or 45,
+		verify=verify_ssl,
+	)
+	response.raise_for_status()
+
+	data = response.json()
+	data = data.get("message", data)
+	if isinstance(data, dict) and data.get("success") is False:
+		frappe.throw(data.get("error") or _("Unknown API error"))
+
+	return data
@@ -0,0 +1,5 @@
+from stock_sync import rollup
+
+
+def execute():
+	rollup.rebuild()
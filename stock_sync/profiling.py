@@ -0,0 +1,211 @@
+# stock_sync/profiling.py - opt-in SQL and CPU profiling of the stock_sync.api entry points
+import functools
+import inspect
+import json
+import sys
+import threading
+import time
+from collections import Counter
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 64
+
+
+def profiled(fn):
+	"""
+	Profile a call when asked for with `?profile=1` (System Managers only), or
+	when the `site_name` it is called for has Profile Syncs enabled. The result
+	is attached as a JSON file to the call's Stock Sync Log.
+	"""
+	signature = inspect.signature(fn)
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		if get_active_profiler() or not should_profile(signature, args, kwargs):
+			return fn(*args, **kwargs)
+
+		profiler = Profiler(fn.__name__)
+		with profiler:
+			result = fn(*args, **kwargs)
+
+		try:
+			profiler.save(result)
+		except Exception:
+			frappe.log_error(title="Stock Sync Profiling Error", message=frappe.get_traceback())
+
+		return result
+
+	return wrapper
+
+
+def should_profile(signature, args, kwargs):
+	if cint(frappe.form_dict.get("profile")) and "System Manager" in frappe.get_roles():
+		return True
+
+	site_name = signature.bind_partial(*args, **kwargs).arguments.get("site_name")
+	return bool(site_name and frappe.db.get_value("Site Connection", site_name, "enable_profiling"))
+
+
+def get_active_profiler():
+	return getattr(frappe.local, "stock_sync_profiler", None)
+
+
+def bind_log(method, log_name):
+	"""
+	Attach the running profile of `method` to an existing Stock Sync Log
+	instead of creating a new one
+	"""
+	profiler = get_active_profiler()
+	if profiler and profiler.method == method and not profiler.log_name:
+		profiler.log_name = log_name
+
+
+class Profiler:
+	"""
+	Records every frappe.db.sql call with its duration, and samples the
+	calling thread's Python stack every SAMPLE_INTERVAL seconds.
+	"""
+
+	def __init__(self, method):
+		self.method = method
+		self.log_name = None
+		self.queries = []
+		self.samples = Counter()
+		self.started_at = None
+		self.wall_time = 0
+		self._started = 0
+
+		self._patched = []
+		self._thread_id = None
+		self._stop = threading.Event()
+		self._sampler = None
+
+	def __enter__(self):
+		self.started_at = now_datetime()
+		self._thread_id = threading.get_ident()
+		self._patch_sql()
+
+		self._sampler = threading.Thread(target=self._sample, daemon=True)
+		self._sampler.start()
+
+		frappe.local.stock_sync_profiler = self
+		self._started = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.wall_time = time.perf_counter() - self._started
+		frappe.local.stock_sync_profiler = None
+
+		self._stop.set()
+		self._sampler.join()
+		self._unpatch_sql()
+
+	def _patch_sql(self):
+		self.patch_db(frappe.local.db)
+
+	def patch_db(self, db, replica=False):
+		"""
+		Record the queries of `db` too. The primary connection is patched on
+		entry; stock_sync.replica patches the replica connection it switches to.
+		"""
+		if "sql" in db.__dict__:
+			return
+
+		original = db.sql
+
+		def sql(query, *args, **kwargs):
+			started = time.perf_counter()
+			try:
+				return original(query, *args, **kwargs)
+			finally:
+				self.queries.append(
+					{
+						"query": str(getattr(db, "last_query", None) or query),
+						"duration_ms": round((time.perf_counter() - started) * 1000, 3),
+						"replica": replica,
+					}
+				)
+
+		db.sql = sql
+		self._patched.append(db)
+
+	def _unpatch_sql(self):
+		# Drop the instance attributes so the class method is visible again
+		for db in self._patched:
+			db.__dict__.pop("sql", None)
+
+	def _sample(self):
+		while not self._stop.wait(SAMPLE_INTERVAL):
+			frame = sys._current_frames().get(self._thread_id)
+			stack = []
+			while frame and len(stack) < MAX_STACK_DEPTH:
+				code = frame.f_code
+				stack.append(f"{code.co_filename}:{code.co_name}:{frame.f_lineno}")
+				frame = frame.f_back
+
+			if stack:
+				self.samples[";".join(reversed(stack))] += 1
+
+	def get_profile(self):
+		sql_time = sum(q["duration_ms"] for q in self.queries)
+		return {
+			"method": self.method,
+			"started_at": self.started_at.isoformat(),
+			"wall_time_ms": round(self.wall_time * 1000, 3),
+			"sql_count": len(self.queries),
+			"sql_time_ms": round(sql_time, 3),
+			"slowest_queries": sorted(self.queries, key=lambda q: -q["duration_ms"])[:20],
+			"queries": self.queries,
+			"sample_interval_ms": SAMPLE_INTERVAL * 1000,
+			# Collapsed stacks ("frame;frame;frame count"), as read by flamegraph tools
+			"cpu_samples": [f"{stack} {count}" for stack, count in self.samples.most_common()],
+		}
+
+	def save(self, result=None):
+		profile = self.get_profile()
+		log_name = self.log_name
+
+		if not log_name:
+			success = isinstance(result, dict) and result.get("success")
+			log_name = (
+				frappe.get_doc(
+					{
+						"doctype": "Stock Sync Log",
+						"sync_date": self.started_at,
+						"status": "Success" if success else "Failed",
+						"items_count": result.get("count") if isinstance(result, dict) else None,
+					}
+				)
+				.insert(ignore_permissions=True)
+				.name
+			)
+
+		file_doc = frappe.get_doc(
+			{
+				"doctype": "File",
+				"file_name": f"profile-{self.method}-{log_name}.json",
+				"attached_to_doctype": "Stock Sync Log",
+				"attached_to_name": log_name,
+				"is_private": 1,
+				"content": json.dumps(profile, indent=1, default=str),
+			}
+		)
+		file_doc.save(ignore_permissions=True)
+
+		frappe.db.set_value(
+			"Stock Sync Log",
+			log_name,
+			{
+				"profiled_method": self.method,
+				"sql_count": profile["sql_count"],
+				"sql_time_ms": profile["sql_time_ms"],
+				"wall_time_ms": profile["wall_time_ms"],
+				"profile_file": file_doc.file_url,
+			},
+		)
+		frappe.db.commit()
+
+		return log_name
@@ -0,0 +1,241 @@
+# stock_sync/rate_limit.py - per-API-key token buckets and concurrency quotas for the export endpoints
+#
+# Each API key has a token bucket and a set of in-flight exports in Redis, checked and
+# updated by one Lua script so concurrent workers can't overspend. Full unfiltered
+# exports cost more tokens than filtered ones. Limited requests get HTTP 429 with
+# Retry-After. Limits come from site_config:
+#
+#   "stock_sync_rate_limits": {
+#       "default": {"rate_per_minute": 60, "burst": 120, "max_concurrent": 2},
+#       "<api key>": {"rate_per_minute": 600, "burst": 600, "max_concurrent": 8}
+#   }
+import functools
+import json
+import math
+import time
+from datetime import datetime, timezone
+
+import frappe
+from frappe.utils import cint, convert_utc_to_system_timezone, flt
+from werkzeug.wrappers import Response
+
+KEY_PREFIX = "stock_sync:rate_limit"
+
+DEFAULT_LIMITS = {
+	"rate_per_minute": 60,
+	"burst": 120,
+	"max_concurrent": 2,
+}
+
+# Tokens taken by one request
+FULL_EXPORT_COST = 10
+FILTERED_EXPORT_COST = 1
+
+# An in-flight export older than this is assumed to have died without releasing its slot
+STALE_EXPORT_SECONDS = 600
+
+# Retry-After sent when the concurrency quota, not the bucket, is exhausted
+CONCURRENCY_RETRY_AFTER = 5
+
+# KEYS: bucket hash, in-flight sorted set, set of known API keys
+# ARGV: now, tokens per second, burst, cost, max concurrent, request id, stale after, api key
+# Returns {allowed, tokens left or seconds to wait, "rate" | "concurrency" | ""}
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local max_concurrent = tonumber(ARGV[5])
+local request_id = ARGV[6]
+local stale_after = tonumber(ARGV[7])
+
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated'))
+if tokens == nil then
+    tokens = burst
+    updated = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+redis.call('SADD', KEYS[3], ARGV[8])
+redis.call('HINCRBY', KEYS[1], 'requests', 1)
+redis.call('HSET', KEYS[1], 'last_request', ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - stale_after)
+
+local result
+if max_concurrent > 0 and redis.call('ZCARD', KEYS[2]) >= max_concurrent then
+    result = {0, '0', 'concurrency'}
+elseif tokens < cost then
+    result = {0, tostring((cost - tokens) / rate), 'rate'}
+else
+    tokens = tokens - cost
+    redis.call('HINCRBY', KEYS[1], 'tokens_spent', cost)
+    redis.call('ZADD', KEYS[2], now, request_id)
+    redis.call('EXPIRE', KEYS[2], stale_after)
+    result = {1, tostring(tokens), ''}
+end
+
+if result[1] == 0 then
+    redis.call('HINCRBY', KEYS[1], 'limited', 1)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', ARGV[1])
+return result
+"""
+
+
+def get_api_key():
+	auth_header = frappe.request.headers.get("Authorization", "") if frappe.request else ""
+	if not auth_header.startswith("token "):
+		return None
+	return auth_header[len("token ") :].split(":", 1)[0].strip() or None
+
+
+def get_limits(api_key):
+	config = frappe.conf.get("stock_sync_rate_limits") or {}
+	return {**DEFAULT_LIMITS, **(config.get("default") or {}), **(config.get(api_key) or {})}
+
+
+def get_request_cost():
+	form_dict = frappe.form_dict
+	if cint(form_dict.get("snapshot")):
+		return FILTERED_EXPORT_COST
+	if any(form_dict.get(key) for key in ("warehouse", "item_code", "item_bucket", "updated_since")):
+		return FILTERED_EXPORT_COST
+	return FULL_EXPORT_COST
+
+
+def _redis(*args):
+	# Raw commands: frappe's cache wrapper prefixes and pickles its own hash and set helpers
+	return frappe.cache().execute_command(*args)
+
+
+def _keys(api_key):
+	cache = frappe.cache()
+	return [
+		cache.make_key(f"{KEY_PREFIX}:bucket:{api_key}"),
+		cache.make_key(f"{KEY_PREFIX}:in_flight:{api_key}"),
+		cache.make_key(f"{KEY_PREFIX}:keys"),
+	]
+
+
+def acquire(api_key, cost, request_id):
+	"""
+	Take `cost` tokens and an export slot for `api_key`.
+	Returns (allowed, retry_after seconds, reason).
+	"""
+	limits = get_limits(api_key)
+	rate = max(flt(limits["rate_per_minute"]) / 60, 0.001)
+	burst = max(flt(limits["burst"]), cost)
+
+	allowed, value, reason = frappe.cache().eval(
+		TOKEN_BUCKET_SCRIPT,
+		3,
+		*_keys(api_key),
+		time.time(),
+		rate,
+		burst,
+		cost,
+		cint(limits["max_concurrent"]),
+		request_id,
+		STALE_EXPORT_SECONDS,
+		api_key,
+	)
+
+	if allowed:
+		return True, 0, None
+
+	reason = frappe.safe_decode(reason)
+	if reason == "concurrency":
+		return False, CONCURRENCY_RETRY_AFTER, reason
+	return False, max(1, math.ceil(flt(frappe.safe_decode(value)))), reason
+
+
+def release(api_key, request_id):
+	_redis("ZREM", _keys(api_key)[1], request_id)
+
+
+def too_many_requests(retry_after, reason):
+	"""
+	429 in the same envelope as a whitelisted method's response, so partners
+	parse it like any other error
+	"""
+	error = "Too many concurrent exports" if reason == "concurrency" else "Rate limit exceeded"
+	body = {"message": {"success": False, "error": error, "retry_after": retry_after, "status_code": 429}}
+	response = Response(json.dumps(body), status=429, mimetype="application/json")
+	response.headers["Retry-After"] = str(retry_after)
+	return response
+
+
+def rate_limited(fn):
+	"""
+	Apply the caller's API key limits to an export endpoint. Requests without
+	an API key are left to the endpoint's own authentication check.
+	"""
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		api_key = get_api_key()
+		if not api_key:
+			return fn(*args, **kwargs)
+
+		request_id = frappe.generate_hash(length=16)
+		allowed, retry_after, reason = acquire(api_key, get_request_cost(), request_id)
+		if not allowed:
+			return too_many_requests(retry_after, reason)
+
+		try:
+			return fn(*args, **kwargs)
+		finally:
+			release(api_key, request_id)
+
+	return wrapper
+
+
+def get_counters():
+	"""
+	Usage and current state of every API key that has called an export endpoint
+	"""
+	now = time.time()
+	api_keys = sorted(frappe.safe_decode(key) for key in _redis("SMEMBERS", _keys("")[2]) or [])
+	users = dict(
+		frappe.get_all(
+			"User", filters={"api_key": ("in", api_keys or [""])}, fields=["api_key", "name"], as_list=True
+		)
+	)
+
+	counters = []
+	for api_key in api_keys:
+		bucket_key, in_flight_key = _keys(api_key)[:2]
+		bucket = {
+			frappe.safe_decode(k): frappe.safe_decode(v)
+			for k, v in (_redis("HGETALL", bucket_key) or {}).items()
+		}
+		limits = get_limits(api_key)
+		rate = flt(limits["rate_per_minute"]) / 60
+
+		tokens = flt(bucket.get("tokens"), 2)
+		if bucket.get("updated"):
+			tokens = min(flt(limits["burst"]), tokens + max(0, now - flt(bucket["updated"])) * rate)
+
+		counters.append(
+			{
+				"api_key": api_key,
+				"user": users.get(api_key),
+				"requests": cint(bucket.get("requests")),
+				"limited": cint(bucket.get("limited")),
+				"tokens_spent": cint(bucket.get("tokens_spent")),
+				"tokens": flt(tokens, 2),
+				"in_flight": _redis("ZCOUNT", in_flight_key, now - STALE_EXPORT_SECONDS, "+inf"),
+				"last_request": _to_system_time(bucket.get("last_request")),
+				**limits,
+			}
+		)
+
+	return counters
+
+
+def _to_system_time(timestamp):
+	if not timestamp:
+		return None
+	utc = datetime.fromtimestamp(flt(timestamp), timezone.utc)
+	return convert_utc_to_system_timezone(utc).replace(tzinfo=None)
@@ -0,0 +1,183 @@
+# stock_sync/replica.py - routing the heavy read-only queries to a read replica
+#
+# Uses Frappe's replica settings in site_config (read_from_replica, replica_host,
+# replica_db_port, different_credentials_for_replica). A replica is only used while
+# it is reachable and no more than stock_sync_replica_max_lag seconds behind;
+# otherwise queries run on the primary. The replica's state is checked at most
+# every STATUS_CHECK_INTERVAL seconds and shared through Redis.
+#
+# The lag is read with SHOW SLAVE STATUS, which needs a global privilege that a site's
+# database user doesn't get by default. Grant it to the user the replica is read as:
+#
+#   GRANT REPLICATION CLIENT ON *.* TO '<user>'@'%';   -- MySQL, MariaDB before 10.5
+#   GRANT SLAVE MONITOR ON *.* TO '<user>'@'%';        -- MariaDB 10.5 and later
+#
+# Without it every check fails and reads stay on the primary, with the grant to run
+# in the "Stock Sync Replica Unavailable" Error Log.
+import functools
+import time
+from contextlib import contextmanager
+
+import frappe
+import pymysql
+from frappe.utils import cint, now
+
+from stock_sync.profiling import get_active_profiler
+
+STATUS_CACHE_KEY = "stock_sync:replica_status"
+STATUS_CHECK_INTERVAL = 10
+
+DEFAULT_MAX_LAG = 30
+
+# Errors that mean the replica (not the query) failed; the query is retried on the primary
+REPLICA_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+# ER_SPECIFIC_ACCESS_DENIED_ERROR: the user lacks a global privilege the statement needs
+ACCESS_DENIED_ERROR = 1227
+
+
+def is_enabled():
+	return bool(frappe.conf.read_from_replica and frappe.conf.replica_host)
+
+
+def get_max_lag():
+	return cint(frappe.conf.get("stock_sync_replica_max_lag")) or DEFAULT_MAX_LAG
+
+
+def get_max_staleness():
+	"""
+	Seconds a read routed to the replica may be behind the primary: the lag it is
+	allowed, plus how long a healthy check is trusted. 0 when reads stay on the primary.
+	Cursors and timestamps taken around a replica read are moved back by this much,
+	so changes the replica hadn't applied yet are picked up next time.
+	"""
+	if not is_enabled():
+		return 0
+	return get_max_lag() + STATUS_CHECK_INTERVAL
+
+
+def get_status():
+	return frappe.cache().get_value(STATUS_CACHE_KEY)
+
+
+def set_status(healthy, lag=None, error=None):
+	previous = get_status() or {}
+	status = {
+		"healthy": healthy,
+		"lag": lag,
+		"error": error,
+		"checked_at": time.time(),
+		"checked_on": now(),
+	}
+	frappe.cache().set_value(STATUS_CACHE_KEY, status)
+
+	# Logged when the replica goes bad, not on every check while it stays bad
+	if not healthy and previous.get("healthy", True):
+		frappe.log_error(
+			title="Stock Sync Replica Unavailable", message=f"Falling back to the primary database: {error}"
+		)
+
+	return status
+
+
+def get_replica_user():
+	conf = frappe.conf
+	if conf.different_credentials_for_replica:
+		return conf.replica_db_name, conf.replica_db_password
+	return conf.db_name, conf.db_password
+
+
+def connect_replica():
+	from frappe.database import get_db
+
+	user, password = get_replica_user()
+	return get_db(
+		host=frappe.conf.replica_host, user=user, password=password, port=frappe.conf.replica_db_port
+	)
+
+
+def check_replica(db):
+	"""
+	Whether the replica is usable, given the lag it reports
+	"""
+	try:
+		replication = db.sql("SHOW SLAVE STATUS", as_dict=1)
+	except REPLICA_ERRORS as e:
+		if e.args and e.args[0] == ACCESS_DENIED_ERROR:
+			# A setup problem rather than an outage: say what to grant
+			user = get_replica_user()[0]
+			return set_status(
+				False,
+				error=(
+					f"The database user {user} can't read the replication lag ({e.args[-1]}). "
+					f"Grant it REPLICATION CLIENT (SLAVE MONITOR on MariaDB 10.5 and later): "
+					f"GRANT REPLICATION CLIENT ON *.* TO '{user}'@'%';"
+				),
+			)["healthy"]
+		return set_status(False, error=str(e))["healthy"]
+
+	lag = replication[0].get("Seconds_Behind_Master") if replication else None
+	if lag is None:
+		return set_status(False, error="Replication is not running")["healthy"]
+	if cint(lag) > get_max_lag():
+		return set_status(False, lag=cint(lag), error=f"{lag}s behind the primary")["healthy"]
+
+	return set_status(True, lag=cint(lag))["healthy"]
+
+
+@contextmanager
+def use_replica():
+	"""
+	Run the block against the read replica when it is usable. Yields whether it is.
+	Nested uses (and Frappe's own read_only) keep the connection already in place.
+	"""
+	if not is_enabled() or getattr(frappe.local, "primary_db", None):
+		yield False
+		return
+
+	status = get_status()
+	if status and time.time() - status["checked_at"] < STATUS_CHECK_INTERVAL and not status["healthy"]:
+		yield False
+		return
+
+	replica_db = connect_replica()
+	if not status or time.time() - status["checked_at"] >= STATUS_CHECK_INTERVAL:
+		if not check_replica(replica_db):
+			replica_db.close()
+			yield False
+			return
+
+	frappe.local.primary_db = frappe.local.db
+	frappe.local.db = replica_db
+
+	# Queries run here are part of the call being profiled too
+	profiler = get_active_profiler()
+	if profiler:
+		profiler.patch_db(replica_db, replica=True)
+
+	try:
+		yield True
+	finally:
+		frappe.local.db = frappe.local.primary_db
+		frappe.local.primary_db = None
+		replica_db.close()
+
+
+def replica_read(fn):
+	"""
+	Run a read-only function on the replica when it is usable, and again on
+	the primary if the replica fails under it
+	"""
+
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		with use_replica() as on_replica:
+			if on_replica:
+				try:
+					return fn(*args, **kwargs)
+				except REPLICA_ERRORS as e:
+					set_status(False, error=str(e))
+
+		return fn(*args, **kwargs)
+
+	return wrapper
@@ -0,0 +1,134 @@
+# stock_sync/report_cache.py - prepared External Stock View report results
+#
+# Results are computed by a background job, one per filter set at a time, and kept
+# gzip-compressed in the site's private folder. An index in Redis maps each filter
+# set to its file and the time its query started; a sync that changes a site's rows
+# marks that site invalidated after it commits, which retires every result for it.
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import frappe
+from frappe.utils import cstr, now
+from frappe.utils.background_jobs import is_job_enqueued
+
+INDEX_CACHE_KEY = "stock_sync:report_cache"
+INVALIDATED_CACHE_KEY = "stock_sync:report_invalidated"
+
+# Results older than this are prepared again even if no sync touched them
+MAX_AGE_HOURS = 24
+
+# Filters that pick how the report runs rather than which rows it shows
+MODE_FILTERS = ("prepared",)
+
+REPORT_MODULE = "stock_sync.stock_sync.report.external_stock_view.external_stock_view"
+
+
+def get_cache_dir():
+	return frappe.get_site_path("private", "stock_sync_report_cache")
+
+
+def get_filters_key(filters):
+	values = {
+		key: cstr(value)
+		for key, value in (filters or {}).items()
+		if key not in MODE_FILTERS and value not in (None, "", 0, "0")
+	}
+	return hashlib.sha1(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def get_job_id(key):
+	return f"stock_sync:prepare_report:{key}"
+
+
+def get_prepared(filters):
+	"""
+	(columns, data, prepared_at) for the filter set, or None when there is no
+	valid prepared result yet. A miss starts preparing it unless that is already
+	under way.
+	"""
+	key = get_filters_key(filters)
+	entry = frappe.cache().hget(INDEX_CACHE_KEY, key)
+
+	if entry and is_valid(entry):
+		try:
+			with gzip.open(entry["path"], "rt") as f:
+				result = json.load(f)
+			return result["columns"], result["data"], entry["prepared_at"]
+		except OSError:
+			pass
+
+	enqueue_prepare(key, filters)
+	return None
+
+
+def is_valid(entry):
+	if time.time() - entry["started_at"] > MAX_AGE_HOURS * 3600:
+		return False
+
+	cache = frappe.cache()
+	if entry.get("source_site"):
+		last_invalidated = cache.hget(INVALIDATED_CACHE_KEY, entry["source_site"]) or 0
+	else:
+		last_invalidated = max((cache.hgetall(INVALIDATED_CACHE_KEY) or {}).values(), default=0)
+
+	return entry["started_at"] > last_invalidated
+
+
+def enqueue_prepare(key, filters):
+	job_id = get_job_id(key)
+	if is_job_enqueued(job_id):
+		return False
+
+	frappe.enqueue(
+		f"{REPORT_MODULE}.prepare",
+		queue="long",
+		job_id=job_id,
+		deduplicate=True,
+		key=key,
+		filters=dict(filters),
+		user=frappe.session.user,
+	)
+	return True
+
+
+def store(key, filters, started_at, columns, data):
+	os.makedirs(get_cache_dir(), exist_ok=True)
+	path = os.path.join(get_cache_dir(), f"{key}.json.gz")
+
+	# Written aside and renamed, so readers never see a partial file
+	tmp_path = f"{path}.{os.getpid()}.tmp"
+	with gzip.open(tmp_path, "wt", compresslevel=6) as f:
+		json.dump({"columns": columns, "data": data}, f, default=str, separators=(",", ":"))
+	os.replace(tmp_path, path)
+
+	entry = {
+		"path": path,
+		"source_site": filters.get("source_site"),
+		"started_at": started_at,
+		"prepared_at": now(),
+		"rows": len(data),
+	}
+	frappe.cache().hset(INDEX_CACHE_KEY, key, entry)
+	return entry
+
+
+def invalidate(site_name):
+	"""
+	Retire prepared results that include `site_name`. Called once a sync that
+	changed the site's rows has committed.
+	"""
+	cache = frappe.cache()
+	now = time.time()
+	cache.hset(INVALIDATED_CACHE_KEY, site_name, now)
+
+	for key, entry in (cache.hgetall(INDEX_CACHE_KEY) or {}).items():
+		if entry.get("source_site") in (None, "", site_name) and entry["started_at"] < now:
+			# hgetall leaves the hash keys as bytes
+			cache.hdel(INDEX_CACHE_KEY, frappe.safe_decode(key))
+			try:
+				os.remove(entry["path"])
+			except OSError:
+				pass
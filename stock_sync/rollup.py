@@ -0,0 +1,206 @@
+# stock_sync/rollup.py - per-item totals across all partners, maintained incrementally
+#
+# External Stock Rollup holds one row per item_code with the summed quantities,
+# the number of sites holding the item and the latest time any of its rows changed.
+# apply_stock_diff feeds every change it writes through apply_changes, inside the
+# same transaction, so dashboards read one row instead of grouping the whole table.
+import frappe
+from frappe.utils import cstr, flt, now_datetime
+
+ROLLUP_FIELDS = (
+	"actual_qty",
+	"reserved_qty",
+	"ordered_qty",
+	"available_qty",
+)
+
+UPSERT_BATCH_SIZE = 500
+
+
+def apply_changes(site_name, changes, sync_time=None):
+	"""
+	Add the old->new row differences of one sync to the rollup.
+	`changes` is a list of (row, sign): +1 for a row written, -1 for a row
+	removed or replaced. Rows carry item_code, origin_site and quantities.
+	"""
+	if not changes:
+		return 0
+
+	sync_time = sync_time or now_datetime()
+	deltas = {}
+	for row, sign in changes:
+		delta = deltas.setdefault(
+			cstr(row.get("item_code")), {"rows": {}, **{field: 0.0 for field in ROLLUP_FIELDS}}
+		)
+		for field in ROLLUP_FIELDS:
+			delta[field] += sign * flt(row.get(field))
+
+		origin_site = cstr(row.get("origin_site"))
+		delta["rows"][origin_site] = delta["rows"].get(origin_site, 0) + sign
+
+	_write(deltas, get_site_count_deltas(site_name, deltas), sync_time)
+	return len(deltas)
+
+
+def remove_site(site_name, totals):
+	"""
+	Take a site's rows out of the rollup before they are removed in bulk.
+	`totals` has one row per (item_code, origin_site) with its summed
+	quantities; the site held at least one row for each, so each lowers
+	the item's site count by one.
+	"""
+	deltas = {}
+	site_deltas = {}
+	for row in totals:
+		item_code = cstr(row.get("item_code"))
+		delta = deltas.setdefault(item_code, {field: 0.0 for field in ROLLUP_FIELDS})
+		for field in ROLLUP_FIELDS:
+			delta[field] -= flt(row.get(field))
+		site_deltas[item_code] = site_deltas.get(item_code, 0) - 1
+
+	_write(deltas, site_deltas, None)
+	return len(deltas)
+
+
+def _write(deltas, site_deltas, sync_time):
+	# Sorted, so concurrent syncs lock rollup rows in the same order
+	now = now_datetime()
+	item_codes = sorted(deltas)
+	for start in range(0, len(item_codes), UPSERT_BATCH_SIZE):
+		batch = item_codes[start : start + UPSERT_BATCH_SIZE]
+		_upsert(
+			[
+				(
+					item_code,
+					item_code,
+					*(deltas[item_code][field] for field in ROLLUP_FIELDS),
+					site_deltas.get(item_code, 0),
+					sync_time,
+					now,
+					now,
+					"Administrator",
+					"Administrator",
+				)
+				for item_code in batch
+			]
+		)
+
+	touched = [item_code for item_code in item_codes if site_deltas.get(item_code, 0) < 0]
+	for start in range(0, len(touched), UPSERT_BATCH_SIZE):
+		frappe.db.delete(
+			"External Stock Rollup",
+			{"name": ("in", touched[start : start + UPSERT_BATCH_SIZE]), "site_count": ("<=", 0)},
+		)
+
+
+def get_site_count_deltas(site_name, deltas):
+	"""
+	{item_code: change in site count}. A site (source site plus origin site, for
+	relayed rows) counts towards an item while it holds at least one row of it, so
+	only items whose row count changed for this site are looked up.
+	"""
+	item_codes = [item_code for item_code, delta in deltas.items() if any(delta["rows"].values())]
+	if not item_codes:
+		return {}
+
+	current = {}
+	for start in range(0, len(item_codes), UPSERT_BATCH_SIZE):
+		for row in frappe.db.sql(
+			"""
+            SELECT item_code, IFNULL(origin_site, '') AS origin_site, COUNT(*) AS row_count
+            FROM `tabExternal Stock View`
+            WHERE source_site = %(site)s AND item_code IN %(item_codes)s
+            GROUP BY item_code, IFNULL(origin_site, '')
+        """,
+			{"site": site_name, "item_codes": item_codes[start : start + UPSERT_BATCH_SIZE]},
+			as_dict=1,
+		):
+			current[(row.item_code, row.origin_site)] = row.row_count
+
+	site_deltas = {}
+	for item_code in item_codes:
+		for origin_site, row_delta in deltas[item_code]["rows"].items():
+			if not row_delta:
+				continue
+			after = current.get((item_code, origin_site), 0)
+			before = after - row_delta
+			site_deltas[item_code] = site_deltas.get(item_code, 0) + (after > 0) - (before > 0)
+
+	return site_deltas
+
+
+def _upsert(values):
+	totals = [f"total_{field}" for field in ROLLUP_FIELDS]
+	columns = [
+		"name",
+		"item_code",
+		*totals,
+		"site_count",
+		"last_sync",
+		"creation",
+		"modified",
+		"owner",
+		"modified_by",
+	]
+	placeholders = ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(values))
+	updates = ", ".join(f"`{column}` = `{column}` + VALUES(`{column}`)" for column in (*totals, "site_count"))
+
+	frappe.db.sql(
+		f"""
+        INSERT INTO `tabExternal Stock Rollup` ({", ".join(f"`{column}`" for column in columns)})
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE
+            {updates},
+            `last_sync` = GREATEST(COALESCE(`last_sync`, VALUES(`last_sync`)), COALESCE(VALUES(`last_sync`), `last_sync`)),
+            `modified` = VALUES(`modified`)
+    """,
+		[value for row in values for value in row],
+	)
+
+
+def rebuild():
+	"""
+	Recompute the whole rollup from External Stock View in one transaction.
+	Returns the number of items in the rebuilt rollup.
+	"""
+	frappe.db.delete("External Stock Rollup")
+	_insert_from_view()
+	frappe.db.commit()
+
+	return frappe.db.count("External Stock Rollup")
+
+
+def rebuild_items(item_codes):
+	"""
+	Recompute the rollup rows of `item_codes` from External Stock View
+	"""
+	item_codes = sorted(set(item_codes))
+	for start in range(0, len(item_codes), UPSERT_BATCH_SIZE):
+		batch = item_codes[start : start + UPSERT_BATCH_SIZE]
+		frappe.db.delete("External Stock Rollup", {"name": ("in", batch)})
+		_insert_from_view("AND item_code IN %(item_codes)s", {"item_codes": batch})
+
+
+def _insert_from_view(conditions="", values=None):
+	frappe.db.sql(
+		f"""
+        INSERT INTO `tabExternal Stock Rollup`
+            (name, item_code, total_actual_qty, total_reserved_qty, total_ordered_qty,
+             total_available_qty, site_count, last_sync, creation, modified, owner, modified_by)
+        SELECT
+            item_code,
+            item_code,
+            SUM(actual_qty),
+            SUM(reserved_qty),
+            SUM(ordered_qty),
+            SUM(available_qty),
+            COUNT(DISTINCT source_site, IFNULL(origin_site, '')),
+            MAX(last_sync),
+            %(now)s, %(now)s, 'Administrator', 'Administrator'
+        FROM `tabExternal Stock View`
+        WHERE IFNULL(item_code, '') != ''
+        {conditions}
+        GROUP BY item_code
+    """,
+		{**(values or {}), "now": now_datetime()},
+	)
@@ -0,0 +1,196 @@
+# stock_sync/row_diff.py
+import hashlib
+import json
+from functools import partial
+
+import frappe
+from frappe.utils import cstr, now_datetime
+
+from stock_sync import report_cache, rollup
+from stock_sync.decoder import add_reject, log_rejects, new_rejects
+
+# Columns that make up a row's content. A change in any of them changes the row hash.
+HASHED_FIELDS = (
+	"actual_qty",
+	"reserved_qty",
+	"ordered_qty",
+	"available_qty",
+)
+
+DELETE_BATCH_SIZE = 500
+
+# Items are spread over checksum buckets by the first hex digits of MD5(item_code),
+# computed the same way in SQL and in Python.
+BUCKET_PREFIX_LENGTH = 2
+
+
+def row_key(row):
+	return (cstr(row.get("origin_site")), cstr(row.get("item_code")), cstr(row.get("warehouse")))
+
+
+def get_item_bucket(item_code):
+	return hashlib.md5(cstr(item_code).encode()).hexdigest()[:BUCKET_PREFIX_LENGTH]
+
+
+def compute_row_hash(row):
+	"""
+	Compact content hash of a decoded row, stored in External Stock View.row_hash
+	"""
+	payload = json.dumps([row.get(field) for field in HASHED_FIELDS], separators=(",", ":"), default=str)
+	return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def get_stored_snapshot(site_name, warehouse=None, item_code=None, item_bucket=None):
+	"""
+	Return {(origin_site, item_code, warehouse): row} for the rows we hold for a site,
+	scoped to the same filters the fetch was made with. Rows carry their name, row_hash
+	and stored quantities. Rows sharing a key with an earlier one are returned separately
+	as duplicates.
+	"""
+	conditions = ["source_site = %(site)s"]
+	values = {"site": site_name}
+
+	if warehouse:
+		conditions.append("warehouse = %(warehouse)s")
+		values["warehouse"] = warehouse
+
+	if item_code:
+		conditions.append("item_code = %(item_code)s")
+		values["item_code"] = item_code
+
+	if item_bucket:
+		conditions.append(f"LEFT(MD5(item_code), {BUCKET_PREFIX_LENGTH}) = %(item_bucket)s")
+		values["item_bucket"] = item_bucket
+
+	rows = frappe.db.sql(
+		f"""
+        SELECT name, origin_site, item_code, warehouse, row_hash, {", ".join(HASHED_FIELDS)}
+        FROM `tabExternal Stock View`
+        WHERE {" AND ".join(conditions)}
+    """,
+		values,
+		as_dict=1,
+	)
+
+	snapshot = {}
+	duplicates = []
+	for row in rows:
+		key = row_key(row)
+		if key in snapshot:
+			duplicates.append(row)
+		else:
+			snapshot[key] = row
+
+	return snapshot, duplicates
+
+
+def diff_stock_rows(incoming_rows, snapshot, duplicates=None, partial=False):
+	"""
+	Compare decoded incoming rows against a stored snapshot.
+	Returns a dict with `inserts`, `updates` (list of (name, row)), `replaced_rows` (stored
+	rows being updated, by name), `deletes` (names), `deleted_rows` (stored rows that are gone),
+	`duplicate_rows` and `unchanged` (count). Every incoming row gets its `row_hash` set.
+	A `partial` payload only carries changed rows, so nothing is deleted.
+	"""
+	inserts = []
+	updates = []
+	replaced_rows = {}
+	unchanged = 0
+	seen = set()
+
+	for row in incoming_rows:
+		key = row_key(row)
+		if key in seen:
+			continue
+		seen.add(key)
+
+		row["row_hash"] = compute_row_hash(row)
+		stored = snapshot.get(key)
+
+		if not stored:
+			inserts.append(row)
+		elif stored.row_hash != row["row_hash"]:
+			updates.append((stored.name, row))
+			replaced_rows[stored.name] = stored
+		else:
+			unchanged += 1
+
+	deleted_rows = []
+	if not partial:
+		deleted_rows = [stored for key, stored in snapshot.items() if key not in seen]
+	deletes = [stored.name for stored in deleted_rows]
+	deletes.extend(stored.name for stored in duplicates or [])
+
+	return {
+		"inserts": inserts,
+		"updates": updates,
+		"replaced_rows": replaced_rows,
+		"deletes": deletes,
+		"deleted_rows": deleted_rows,
+		"duplicate_rows": duplicates or [],
+		"unchanged": unchanged,
+	}
+
+
+def apply_stock_diff(site_name, diff, rejects=None):
+	"""
+	Write only the changed rows of a diff to External Stock View, and the
+	same changes to the per-item rollup (stock_sync.rollup).
+	Rows that fail to write are added to `rejects` (see stock_sync.decoder) for
+	the caller's summary, or summarized here when no `rejects` is passed.
+	Returns the counts of rows actually inserted, updated and deleted.
+	"""
+	log_here = rejects is None
+	if log_here:
+		rejects = new_rejects()
+
+	sync_time = now_datetime()
+	inserted = updated = 0
+	# (row, sign) of every change written
+	applied = []
+
+	for row in diff["inserts"]:
+		try:
+			frappe.get_doc(
+				{"doctype": "External Stock View", "source_site": site_name, "last_sync": sync_time, **row}
+			).insert(ignore_permissions=True)
+			inserted += 1
+			applied.append((row, 1))
+
+		except Exception as item_error:
+			add_reject(rejects, "insert_failed", {**row, "error": str(item_error)})
+
+	for name, row in diff["updates"]:
+		try:
+			values = {field: row.get(field) for field in HASHED_FIELDS}
+			values["row_hash"] = row["row_hash"]
+			values["last_sync"] = sync_time
+			frappe.db.set_value("External Stock View", name, values)
+			updated += 1
+			applied.append((diff["replaced_rows"][name], -1))
+			applied.append((row, 1))
+
+		except Exception as item_error:
+			add_reject(rejects, "update_failed", {**row, "error": str(item_error)})
+
+	deletes = diff["deletes"]
+	for start in range(0, len(deletes), DELETE_BATCH_SIZE):
+		frappe.db.delete("External Stock View", {"name": ("in", deletes[start : start + DELETE_BATCH_SIZE])})
+	applied.extend((stored, -1) for stored in diff["deleted_rows"])
+	applied.extend((stored, -1) for stored in diff["duplicate_rows"])
+
+	rollup.apply_changes(site_name, applied, sync_time)
+
+	if log_here:
+		log_rejects(site_name, rejects, len(diff["inserts"]) + len(diff["updates"]))
+
+	# Prepared report results for the site go stale once these changes commit
+	if applied:
+		frappe.db.after_commit.add(partial(report_cache.invalidate, site_name))
+
+	return {
+		"inserted": inserted,
+		"updated": updated,
+		"deleted": len(deletes),
+		"unchanged": diff["unchanged"],
+	}
@@ -0,0 +1,200 @@
+# stock_sync/scheduler.py - adaptive sync scheduling driven by each site's observed change rate
+import heapq
+
+import frappe
+from frappe.utils import add_to_date, cint, flt, get_datetime, now_datetime
+from frappe.utils.background_jobs import is_job_enqueued
+
+from stock_sync import api, hub
+
+# Syncs looked at to estimate a site's change rate
+HISTORY_SIZE = 10
+
+# The interval aims for about this many changed rows per sync
+TARGET_CHANGES_PER_SYNC = 50
+
+DEFAULT_MIN_INTERVAL = 5
+DEFAULT_MAX_INTERVAL = 240
+
+# Syncs allowed in flight at once across all sites (site_config: stock_sync_max_concurrent_syncs)
+DEFAULT_MAX_CONCURRENT_SYNCS = 4
+
+
+def run_due_syncs():
+	"""
+	Scheduled every minute: enqueue the most overdue sites, up to the global
+	concurrency budget
+	"""
+	budget = cint(frappe.conf.get("stock_sync_max_concurrent_syncs")) or DEFAULT_MAX_CONCURRENT_SYNCS
+	now = now_datetime()
+
+	sites = get_schedulable_sites()
+	in_flight = sum(1 for site in sites if is_job_enqueued(get_job_id(site.name)))
+	available = budget - in_flight
+	if available <= 0:
+		return []
+
+	# Priority queue of due sites, most overdue first; never-synced sites first of all
+	queue = [
+		(
+			get_datetime(site.next_sync_due) if site.next_sync_due else get_datetime("1970-01-01"),
+			site.name,
+			site,
+		)
+		for site in sites
+		if not site.next_sync_due or get_datetime(site.next_sync_due) <= now
+	]
+	heapq.heapify(queue)
+
+	enqueued = []
+	while queue and len(enqueued) < available:
+		_due, name, site = heapq.heappop(queue)
+		job_id = get_job_id(name)
+		if is_job_enqueued(job_id):
+			continue
+
+		# Provisional, so the next tick doesn't pick the site again while it runs
+		frappe.db.set_value(
+			"Site Connection",
+			name,
+			"next_sync_due",
+			add_to_date(now, minutes=get_interval_bounds(site)[1]),
+			update_modified=False,
+		)
+
+		frappe.enqueue(
+			"stock_sync.scheduler.sync_site", queue="long", job_id=job_id, deduplicate=True, site_name=name
+		)
+		enqueued.append(name)
+
+	frappe.db.commit()
+	return enqueued
+
+
+def sync_site(site_name):
+	"""
+	Background job: sync one site, then schedule its next sync from its change rate
+	"""
+	result = None
+	try:
+		result = api.fetch_from_site(site_name)
+	finally:
+		update_schedule(site_name, retry_after=(result or {}).get("retry_after"))
+		frappe.db.commit()
+
+
+def update_schedule(site_name, retry_after=None):
+	"""
+	Schedule a site's next sync from its change rate, backed off while its
+	syncs keep failing, but no sooner than `retry_after` seconds when the
+	partner rate limited us
+	"""
+	site = frappe.db.get_value(
+		"Site Connection", site_name, ["name", "min_sync_interval", "max_sync_interval"], as_dict=1
+	)
+	if not site:
+		return
+
+	interval = get_next_interval(site, get_change_rate(site_name), get_failure_streak(site_name))
+	next_sync_due = add_to_date(now_datetime(), minutes=interval)
+	if retry_after:
+		next_sync_due = max(next_sync_due, add_to_date(now_datetime(), seconds=cint(retry_after)))
+
+	frappe.db.set_value(
+		"Site Connection",
+		site_name,
+		{"sync_interval": interval, "next_sync_due": next_sync_due},
+		update_modified=False,
+	)
+
+
+def get_change_rate(site_name):
+	"""
+	Changed rows per minute over the site's recent successful syncs. A sync
+	that changed nothing (the equivalent of an ETag hit) pulls the rate down.
+	Reconcile runs only repair drift, so they are left out.
+	Returns None when there is not enough history.
+	"""
+	logs = frappe.get_all(
+		"Stock Sync Log",
+		filters={"site": site_name, "status": "Success", "sync_type": "Sync"},
+		fields=["sync_date", "inserted_count", "updated_count", "deleted_count"],
+		order_by="sync_date desc",
+		limit=HISTORY_SIZE + 1,
+	)
+
+	if len(logs) < 2:
+		return None
+
+	# Changes seen by each sync happened since the sync before it
+	changed = sum(
+		cint(log.inserted_count) + cint(log.updated_count) + cint(log.deleted_count) for log in logs[:-1]
+	)
+	minutes = (get_datetime(logs[0].sync_date) - get_datetime(logs[-1].sync_date)).total_seconds() / 60
+	if minutes <= 0:
+		return None
+
+	return changed / minutes
+
+
+def get_failure_streak(site_name):
+	"""
+	Syncs that failed in a row since the site's last successful one, up to HISTORY_SIZE
+	"""
+	statuses = frappe.get_all(
+		"Stock Sync Log",
+		filters={"site": site_name, "status": ("in", ("Success", "Failed")), "sync_type": "Sync"},
+		pluck="status",
+		order_by="sync_date desc",
+		limit=HISTORY_SIZE,
+	)
+
+	streak = 0
+	for status in statuses:
+		if status != "Failed":
+			break
+		streak += 1
+	return streak
+
+
+def get_interval_bounds(site):
+	min_interval = cint(site.min_sync_interval) or DEFAULT_MIN_INTERVAL
+	max_interval = max(cint(site.max_sync_interval) or DEFAULT_MAX_INTERVAL, min_interval)
+	return min_interval, max_interval
+
+
+def get_next_interval(site, change_rate, failures=0):
+	"""
+	Minutes until the next sync: long enough to collect about
+	TARGET_CHANGES_PER_SYNC changes, doubled for every sync that failed in a
+	row, within the site's bounds
+	"""
+	min_interval, max_interval = get_interval_bounds(site)
+
+	if change_rate is None:
+		interval = min_interval
+	elif not change_rate:
+		interval = max_interval
+	else:
+		interval = max(TARGET_CHANGES_PER_SYNC / flt(change_rate), min_interval)
+
+	# The change rate only reads successful syncs, so a partner that is down keeps its last rate
+	return int(min(interval * 2**failures, max_interval))
+
+
+def get_schedulable_sites():
+	# Spokes of a hub sync only with the hub
+	hubs = hub.get_active_hubs()
+	filters = {"is_active": 1}
+	if hubs:
+		filters["name"] = ("in", [site.name for site in hubs])
+
+	return frappe.get_all(
+		"Site Connection",
+		filters=filters,
+		fields=["name", "next_sync_due", "min_sync_interval", "max_sync_interval"],
+	)
+
+
+def get_job_id(site_name):
+	return f"stock_sync:sync_site:{site_name}"
@@ -0,0 +1,272 @@
+# stock_sync/snapshots.py - precomputed export snapshots served as static, resumable files
+#
+# Source side: a scheduled job writes the full get_stock_for_external export (and one
+# per enabled Stock Subscription) to a gzip file named after a hash of its content.
+# Partners ask get_stock_for_external?snapshot=1 for the current version and download
+# it with Range requests, so the export costs the same however many partners poll.
+# Consumer side: fetch_snapshot skips unchanged versions and resumes partial downloads.
+import contextlib
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+from urllib.parse import urljoin
+
+import frappe
+import requests
+import urllib3
+from frappe import _
+from frappe.utils import now
+from frappe.utils.background_jobs import is_job_enqueued
+from werkzeug.utils import send_file
+
+from stock_sync import api
+from stock_sync.partner import call_partner
+from stock_sync.subscription import get_user_subscription
+
+SNAPSHOT_CACHE_KEY = "stock_sync:snapshots"
+STOCK_ENDPOINT = "api/method/stock_sync.api.get_stock_for_external"
+DOWNLOAD_ENDPOINT = "api/method/stock_sync.snapshots.download_snapshot"
+
+# Versions kept per scope, so downloads of the previous one can still resume
+KEEP_VERSIONS = 2
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_RESUME_ATTEMPTS = 5
+
+VERSION_PATTERN = re.compile(r"[0-9a-f]{16}")
+
+
+def get_snapshot_dir(*parts):
+	return frappe.get_site_path("private", "stock_sync_snapshots", *parts)
+
+
+def get_scope(subscription=None):
+	"""
+	Snapshot a partner gets: the full export, or its subscription's
+	"""
+	if not subscription:
+		return "all"
+	return "sub-" + hashlib.sha1(subscription.name.encode()).hexdigest()[:12]
+
+
+def get_snapshot_path(scope, version):
+	return get_snapshot_dir(f"{scope}-{version}.json.gz")
+
+
+# Source side
+# -----------
+
+
+def enqueue_build_snapshots():
+	"""
+	Scheduled: hand the builds to the long queue, so a slow export never
+	holds up the default scheduler worker
+	"""
+	job_id = "stock_sync:build_snapshots"
+	if not is_job_enqueued(job_id):
+		frappe.enqueue(
+			"stock_sync.snapshots.build_snapshots",
+			queue="long",
+			job_id=job_id,
+			deduplicate=True,
+		)
+
+
+def build_snapshots():
+	"""
+	Long queue: write a snapshot of the full export and of every enabled
+	subscription's export
+	"""
+	build_snapshot()
+	for subscription in frappe.get_all(
+		"Stock Subscription", filters={"enabled": 1}, fields=["name", "filters_items", "filters_warehouses"]
+	):
+		build_snapshot(subscription)
+
+
+def build_snapshot(subscription=None):
+	scope = get_scope(subscription)
+	rows = api.get_bin_stock(subscription=subscription)
+
+	payload = json.dumps(rows, default=str, separators=(",", ":")).encode()
+	version = hashlib.sha1(payload).hexdigest()[:16]
+	path = get_snapshot_path(scope, version)
+
+	# Same content, same file: nothing to write
+	if not os.path.exists(path):
+		os.makedirs(get_snapshot_dir(), exist_ok=True)
+		tmp_path = f"{path}.{os.getpid()}.tmp"
+		with (
+			open(tmp_path, "wb") as raw,
+			gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as f,
+		):
+			f.write(payload)
+		os.replace(tmp_path, path)
+
+	entry = {
+		"version": version,
+		"size": os.path.getsize(path),
+		"count": len(rows),
+		"generated_at": now(),
+	}
+	frappe.cache().hset(SNAPSHOT_CACHE_KEY, scope, entry)
+	prune(scope, keep=version)
+	return entry
+
+
+def prune(scope, keep):
+	paths = sorted(glob.glob(get_snapshot_dir(f"{scope}-*.json.gz")), key=os.path.getmtime, reverse=True)
+	for path in [p for p in paths if not p.endswith(f"-{keep}.json.gz")][KEEP_VERSIONS - 1 :]:
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+
+def get_snapshot_info(subscription=None):
+	"""
+	get_stock_for_external?snapshot=1: where the partner's current snapshot is
+	"""
+	scope = get_scope(subscription)
+	entry = frappe.cache().hget(SNAPSHOT_CACHE_KEY, scope)
+
+	if not entry or not os.path.exists(get_snapshot_path(scope, entry["version"])):
+		job_id = f"stock_sync:build_snapshot:{scope}"
+		if not is_job_enqueued(job_id):
+			frappe.enqueue(
+				"stock_sync.snapshots.build_snapshot",
+				queue="long",
+				job_id=job_id,
+				deduplicate=True,
+				subscription=subscription,
+			)
+		return {"success": False, "error": "Snapshot not ready", "status_code": 503}
+
+	return {
+		"success": True,
+		"site": frappe.local.site,
+		"snapshot": {**entry, "url": f"{DOWNLOAD_ENDPOINT}?version={entry['version']}"},
+	}
+
+
+@frappe.whitelist(allow_guest=False)
+def download_snapshot(version):
+	"""
+	API for OTHER sites to download a snapshot file. Honours Range and
+	If-Range, so interrupted downloads resume where they stopped.
+	"""
+	# Security check - ensure API key is provided
+	auth_header = frappe.request.headers.get("Authorization", "")
+	if not auth_header.startswith("token "):
+		frappe.throw(_("Authentication required"), frappe.AuthenticationError)
+
+	if not VERSION_PATTERN.fullmatch(version or ""):
+		frappe.throw(_("Invalid snapshot version"), frappe.ValidationError)
+
+	path = get_snapshot_path(get_scope(get_user_subscription()), version)
+	if not os.path.exists(path):
+		frappe.throw(_("Snapshot {0} is no longer available").format(version), frappe.DoesNotExistError)
+
+	# Served from the file by the WSGI file wrapper (sendfile where the server has it)
+	response = send_file(
+		os.path.abspath(path),
+		frappe.request.environ,
+		mimetype="application/gzip",
+		as_attachment=True,
+		download_name=f"stock-{version}.json.gz",
+		conditional=True,
+		etag=version,
+		max_age=31536000,
+	)
+	response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+	return response
+
+
+# Consumer side
+# -------------
+
+
+def fetch_snapshot(site):
+	"""
+	(version, rows) of a partner's current snapshot. rows is None when the
+	version is the one we last applied.
+	"""
+	response = call_partner(site, STOCK_ENDPOINT, {"snapshot": 1})
+	if response.get("site"):
+		site.remote_site_name = response["site"]
+
+	info = response["snapshot"]
+	version = info["version"]
+	if version == site.snapshot_version:
+		return version, None
+
+	path = download(site, info)
+	with gzip.open(path, "rb") as f:
+		payload = f.read()
+
+	if hashlib.sha1(payload).hexdigest()[:16] != version:
+		os.remove(path)
+		frappe.throw(_("Snapshot {0} from {1} failed verification").format(version, site.name))
+
+	os.remove(path)
+	return version, json.loads(payload)
+
+
+def download(site, info):
+	"""
+	Download a snapshot into a partial file, resuming from what an earlier
+	attempt or sync left behind
+	"""
+	os.makedirs(get_snapshot_dir("downloads"), exist_ok=True)
+	prefix = hashlib.sha1(site.name.encode()).hexdigest()[:12]
+	path = get_snapshot_dir("downloads", f"{prefix}-{info['version']}.part")
+
+	# Partial downloads of older versions can't be resumed any more
+	for stale in glob.glob(get_snapshot_dir("downloads", f"{prefix}-*.part")):
+		if stale != path:
+			with contextlib.suppress(FileNotFoundError):
+				os.remove(stale)
+
+	verify_ssl = not site.get("disable_ssl_verification", False)
+	if not verify_ssl:
+		urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+	url = urljoin(site.site_url, info["url"])
+	for attempt in range(MAX_RESUME_ATTEMPTS):
+		offset = os.path.getsize(path) if os.path.exists(path) else 0
+		if offset >= info["size"]:
+			break
+
+		headers = {
+			"Authorization": f"token {site.api_key}:{site.api_secret or ''}",
+			"Range": f"bytes={offset}-",
+			"If-Range": f'"{info["version"]}"',
+		}
+		try:
+			with requests.get(
+				url, headers=headers, stream=True, timeout=site.get("timeout") or 45, verify=verify_ssl
+			) as response:
+				if response.status_code == 416:
+					# Range past the end of the file: start over (another sync may have removed it)
+					with contextlib.suppress(FileNotFoundError):
+						os.remove(path)
+					continue
+				response.raise_for_status()
+
+				# 200 means the server sent the whole file rather than the range
+				mode = "ab" if response.status_code == 206 else "wb"
+				with open(path, mode) as f:
+					for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+						f.write(chunk)
+
+		except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+			if attempt == MAX_RESUME_ATTEMPTS - 1:
+				raise
+
+	if not os.path.exists(path) or os.path.getsize(path) != info["size"]:
+		frappe.throw(_("Incomplete snapshot download from {0}").format(site.name))
+
+	return path
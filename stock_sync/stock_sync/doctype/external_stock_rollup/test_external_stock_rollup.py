@@ -0,0 +1,126 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from stock_sync import rollup
+from stock_sync.row_diff import apply_stock_diff, diff_stock_rows, get_stored_snapshot
+from stock_sync.stock_sync.doctype.external_stock_view.test_external_stock_view import stock_row
+
+TEST_SITE = "_test-rollup-site.example.com"
+ITEM_PREFIX = "_Test Rollup Item"
+
+ROLLUP_COLUMNS = ["item_code", "site_count", *(f"total_{field}" for field in rollup.ROLLUP_FIELDS)]
+
+
+def item(suffix):
+	return f"{ITEM_PREFIX}-{suffix}"
+
+
+class TestExternalStockRollup(FrappeTestCase):
+	def setUp(self):
+		frappe.get_doc(
+			{
+				"doctype": "Site Connection",
+				"site_name": TEST_SITE,
+				"site_url": f"https://{TEST_SITE}/",
+				"api_key": "_test",
+			}
+		).insert(ignore_permissions=True)
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def sync(self, rows, racing=False):
+		snapshot, duplicates = get_stored_snapshot(TEST_SITE)
+		diff = diff_stock_rows(rows, snapshot, duplicates)
+		apply_stock_diff(TEST_SITE, diff)
+		if racing:
+			# A second sync that read the same snapshot writes the same inserts again
+			apply_stock_diff(TEST_SITE, diff)
+
+	def get_rollup(self):
+		return {
+			row.item_code: row
+			for row in frappe.get_all(
+				"External Stock Rollup",
+				filters={"item_code": ("like", f"{ITEM_PREFIX}%")},
+				fields=ROLLUP_COLUMNS,
+			)
+		}
+
+	def assertMatchesRebuild(self):
+		incremental = self.get_rollup()
+		# rebuild() commits; the test's rows must still roll back
+		with patch.object(frappe.db, "commit"):
+			rollup.rebuild()
+		self.assertEqual(incremental, self.get_rollup())
+		return incremental
+
+	def test_inserts_updates_and_deletes(self):
+		self.sync(
+			[
+				stock_row(item("A"), "Stores", qty=5),
+				stock_row(item("A"), "Finished Goods", qty=3),
+				stock_row(item("B"), "Stores", qty=2),
+			]
+		)
+		self.assertMatchesRebuild()
+
+		self.sync([stock_row(item("A"), "Stores", qty=7), stock_row(item("C"), "Stores", qty=4)])
+		totals = self.assertMatchesRebuild()
+
+		self.assertEqual(totals[item("A")].total_actual_qty, 7)
+		self.assertEqual(totals[item("A")].site_count, 1)
+		self.assertNotIn(item("B"), totals)
+		self.assertEqual(totals[item("C")].total_available_qty, 4)
+
+	def test_duplicates_are_taken_out(self):
+		self.sync([stock_row(item("A"), "Stores", qty=5)], racing=True)
+		self.assertMatchesRebuild()
+
+		self.sync([stock_row(item("A"), "Stores", qty=5)])
+		totals = self.assertMatchesRebuild()
+
+		self.assertEqual(frappe.db.count("External Stock View", {"item_code": item("A")}), 1)
+		self.assertEqual(totals[item("A")].total_actual_qty, 5)
+
+	def test_relayed_origin_sites_count_separately(self):
+		self.sync(
+			[
+				stock_row(item("A"), "Stores", qty=5, origin_site="a.example.com"),
+				stock_row(item("A"), "Finished Goods", qty=1, origin_site="a.example.com"),
+				stock_row(item("A"), "Stores", qty=3, origin_site="b.example.com"),
+			]
+		)
+		totals = self.assertMatchesRebuild()
+		self.assertEqual(totals[item("A")].site_count, 2)
+
+		# One of a.example.com's two rows goes: it still holds the item
+		self.sync(
+			[
+				stock_row(item("A"), "Stores", qty=5, origin_site="a.example.com"),
+				stock_row(item("A"), "Stores", qty=3, origin_site="b.example.com"),
+			]
+		)
+		totals = self.assertMatchesRebuild()
+		self.assertEqual(totals[item("A")].site_count, 2)
+
+		self.sync([stock_row(item("A"), "Stores", qty=3, origin_site="b.example.com")])
+		totals = self.assertMatchesRebuild()
+		self.assertEqual(totals[item("A")].site_count, 1)
+		self.assertEqual(totals[item("A")].total_actual_qty, 3)
+
+	def test_rebuild_items_recomputes_only_those_items(self):
+		self.sync([stock_row(item("A"), "Stores", qty=5), stock_row(item("B"), "Stores", qty=2)])
+		frappe.db.set_value("External Stock Rollup", item("A"), "total_actual_qty", 0)
+		frappe.db.set_value("External Stock Rollup", item("B"), "total_actual_qty", 0)
+
+		rollup.rebuild_items([item("A")])
+		totals = self.get_rollup()
+
+		self.assertEqual(totals[item("A")].total_actual_qty, 5)
+		self.assertEqual(totals[item("B")].total_actual_qty, 0)
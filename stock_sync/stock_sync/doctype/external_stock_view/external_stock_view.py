@@ -1,9 +1,14 @@
 # Copyright (c) 2025, Pal Shah and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
 class ExternalStockView(Document):
 	pass
+
+
+def on_doctype_update():
+	# stock_sync.rollup counts a site's rows per item after each sync
+	frappe.db.add_index("External Stock View", ["source_site", "item_code"])
@@ -1,9 +1,79 @@
 # Copyright (c) 2025, Pal Shah and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from stock_sync.row_diff import compute_row_hash, diff_stock_rows, row_key
+
+
+def stock_row(item_code, warehouse, qty=10.0, origin_site=""):
+	return {
+		"item_code": item_code,
+		"warehouse": warehouse,
+		"actual_qty": qty,
+		"reserved_qty": 0.0,
+		"ordered_qty": 0.0,
+		"available_qty": qty,
+		"origin_site": origin_site,
+	}
+
+
+def stored_snapshot(rows):
+	"""{key: stored row} as get_stored_snapshot returns it for rows already written"""
+	return {
+		row_key(row): frappe._dict(row, name=f"ESV-{index}", row_hash=compute_row_hash(row))
+		for index, row in enumerate(rows)
+	}
+
 
 class TestExternalStockView(FrappeTestCase):
-	pass
+	def test_diff_inserts_updates_and_deletes(self):
+		snapshot = stored_snapshot(
+			[
+				stock_row("ITEM-A", "Stores"),
+				stock_row("ITEM-B", "Stores", qty=5),
+				stock_row("ITEM-C", "Stores", qty=3),
+			]
+		)
+		incoming = [
+			stock_row("ITEM-A", "Stores"),
+			stock_row("ITEM-B", "Stores", qty=7),
+			stock_row("ITEM-D", "Stores", qty=1),
+		]
+
+		diff = diff_stock_rows(incoming, snapshot)
+
+		self.assertEqual([row["item_code"] for row in diff["inserts"]], ["ITEM-D"])
+		self.assertEqual([(name, row["actual_qty"]) for name, row in diff["updates"]], [("ESV-1", 7)])
+		self.assertEqual(diff["replaced_rows"]["ESV-1"].actual_qty, 5)
+		self.assertEqual(diff["deletes"], ["ESV-2"])
+		self.assertEqual(diff["unchanged"], 1)
+
+	def test_partial_diff_deletes_nothing(self):
+		snapshot = stored_snapshot([stock_row("ITEM-A", "Stores"), stock_row("ITEM-B", "Stores")])
+
+		diff = diff_stock_rows([stock_row("ITEM-A", "Stores", qty=2)], snapshot, partial=True)
+
+		self.assertEqual(len(diff["updates"]), 1)
+		self.assertEqual(diff["deletes"], [])
+
+	def test_diff_keys_rows_by_origin_site(self):
+		snapshot = stored_snapshot([stock_row("ITEM-A", "Stores", origin_site="a.example.com")])
+
+		diff = diff_stock_rows([stock_row("ITEM-A", "Stores", origin_site="b.example.com")], snapshot)
+
+		self.assertEqual(len(diff["inserts"]), 1)
+		self.assertEqual(diff["deletes"], ["ESV-0"])
+
+	def test_diff_drops_duplicates(self):
+		snapshot = stored_snapshot([stock_row("ITEM-A", "Stores")])
+		duplicate = frappe._dict(stock_row("ITEM-A", "Stores"), name="ESV-DUP")
+
+		diff = diff_stock_rows(
+			[stock_row("ITEM-A", "Stores"), stock_row("ITEM-A", "Stores", qty=99)], snapshot, [duplicate]
+		)
+
+		self.assertEqual(diff["updates"], [])
+		self.assertEqual(diff["unchanged"], 1)
+		self.assertEqual(diff["deletes"], ["ESV-DUP"])
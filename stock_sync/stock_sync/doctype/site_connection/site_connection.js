@@ -162,6 +162,23 @@ frappe.ui.form.on('Site Connection', {
                     site: frm.doc.name
                 });
             }, __('Actions'));
+            
+            // Add Clear Synced Stock button
+            frm.add_custom_button(__('Clear Synced Stock'), function() {
+                frappe.confirm(
+                    __('Remove all stock synced from {0}? It is fetched again on the next sync.', [frm.doc.name]),
+                    function() {
+                        frm.call('clear_synced_stock').then(r => {
+                            if (r.message && r.message.success) {
+                                frappe.show_alert({
+                                    message: __('Clearing stock synced from {0} in the background', [frm.doc.name]),
+                                    indicator: 'green'
+                                });
+                            }
+                        });
+                    }
+                );
+            }, __('Actions'));
         }
     },
     
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Pal Shah and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Stock Alert Rule", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,15 @@
+# Copyright (c) 2026, Pal Shah and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+from stock_sync.alerts import clear_rule_index
+
+
+class StockAlertRule(Document):
+	def on_update(self):
+		clear_rule_index()
+
+	def on_trash(self):
+		clear_rule_index()
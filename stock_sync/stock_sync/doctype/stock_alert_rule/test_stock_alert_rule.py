@@ -0,0 +1,55 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from stock_sync import alerts
+
+TEST_SITE = "_test-alert-site.example.com"
+
+
+class TestStockAlertRule(FrappeTestCase):
+	def setUp(self):
+		frappe.cache().delete_value(alerts.ALERT_STATE_CACHE_KEY)
+		frappe.get_doc(
+			{
+				"doctype": "Stock Alert Rule",
+				"item_code": "_Test Alert Item",
+				"threshold": 10,
+				"notify_user": "Administrator",
+				"debounce_minutes": 60,
+			}
+		).insert()
+
+	def tearDown(self):
+		# FrappeTestCase only rolls back once per class; each test starts from no rules and no logs
+		frappe.db.rollback()
+		frappe.cache().delete_value(alerts.ALERT_STATE_CACHE_KEY)
+		alerts.clear_rule_index()
+
+	def get_notification_count(self):
+		return frappe.db.count("Notification Log", {"document_name": TEST_SITE})
+
+	def test_two_syncs_below_threshold_notify_once(self):
+		row = {"item_code": "_Test Alert Item", "warehouse": "Stores", "available_qty": 2}
+
+		self.assertEqual(alerts.evaluate_alerts(TEST_SITE, [row]), 1)
+		self.assertEqual(alerts.evaluate_alerts(TEST_SITE, [dict(row, available_qty=1)]), 0)
+		self.assertEqual(self.get_notification_count(), 1)
+
+	def test_recovery_within_debounce_stays_quiet(self):
+		row = {"item_code": "_Test Alert Item", "warehouse": "Stores", "available_qty": 2}
+
+		alerts.evaluate_alerts(TEST_SITE, [row])
+		alerts.evaluate_alerts(TEST_SITE, [dict(row, available_qty=50)])
+		self.assertEqual(alerts.evaluate_alerts(TEST_SITE, [row]), 0)
+		self.assertEqual(self.get_notification_count(), 1)
+
+	def test_partner_values_are_escaped(self):
+		row = {"item_code": "_Test Alert Item", "warehouse": "<b>Stores</b>", "available_qty": 2}
+
+		alerts.evaluate_alerts(TEST_SITE, [row])
+
+		content = frappe.db.get_value("Notification Log", {"document_name": TEST_SITE}, "email_content")
+		self.assertIn("&lt;b&gt;Stores&lt;/b&gt;", content)
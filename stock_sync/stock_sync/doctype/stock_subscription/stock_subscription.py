@@ -0,0 +1,74 @@
+# Copyright (c) 2026, Pal Shah and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now_datetime
+
+from stock_sync.subscription import compile_items, compile_warehouses, split_lines
+
+
+class StockSubscription(Document):
+	def validate(self):
+		# compile() rebuilds these in bulk after saving, so they aren't written back row by row
+		self.set("compiled_items", [])
+		self.set("compiled_warehouses", [])
+
+	def on_update(self):
+		self.compile()
+
+	def compile(self):
+		"""Materialize the subscription into the indexed tables get_stock_for_external joins to"""
+		item_codes = compile_items(split_lines(self.item_groups), split_lines(self.items))
+		warehouses = compile_warehouses(split_lines(self.warehouse_patterns))
+
+		self._replace_rows("Stock Subscription Item", "compiled_items", "item_code", item_codes)
+		self._replace_rows("Stock Subscription Warehouse", "compiled_warehouses", "warehouse", warehouses)
+
+		self.db_set(
+			{
+				"filters_items": 1 if (self.item_groups or self.items) else 0,
+				"filters_warehouses": 1 if self.warehouse_patterns else 0,
+				"compiled_item_count": len(item_codes),
+				"compiled_warehouse_count": len(warehouses),
+				"last_compiled": now_datetime(),
+			},
+			update_modified=False,
+		)
+
+	def _replace_rows(self, doctype, parentfield, fieldname, values):
+		frappe.db.delete(doctype, {"parent": self.name})
+		if not values:
+			return
+
+		now = now_datetime()
+		frappe.db.bulk_insert(
+			doctype,
+			[
+				"name",
+				"parent",
+				"parenttype",
+				"parentfield",
+				"idx",
+				fieldname,
+				"creation",
+				"modified",
+				"owner",
+				"modified_by",
+			],
+			[
+				(
+					frappe.generate_hash(length=10),
+					self.name,
+					self.doctype,
+					parentfield,
+					idx,
+					value,
+					now,
+					now,
+					frappe.session.user,
+					frappe.session.user,
+				)
+				for idx, value in enumerate(sorted(values), start=1)
+			],
+		)
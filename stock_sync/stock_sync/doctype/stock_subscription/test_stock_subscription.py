@@ -0,0 +1,39 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from stock_sync import subscription
+
+
+class TestStockSubscription(FrappeTestCase):
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def get_site(self, subscription_hash=None, items=()):
+		return frappe._dict(
+			name="_test-subscription-site.example.com",
+			subscription_hash=subscription_hash,
+			subscriptions=[frappe._dict(subscription_type="Item", value=item) for item in items],
+		)
+
+	def test_empty_subscription_is_not_registered(self):
+		with patch.object(subscription, "call_partner") as call_partner:
+			self.assertFalse(subscription.ensure_registered(self.get_site()))
+
+		call_partner.assert_not_called()
+
+	def test_emptied_subscription_is_registered(self):
+		site = self.get_site(items=["ITEM-A"])
+		with patch.object(subscription, "call_partner") as call_partner:
+			self.assertTrue(subscription.ensure_registered(site))
+			self.assertFalse(subscription.ensure_registered(site))
+
+			site.subscriptions = []
+			self.assertTrue(subscription.ensure_registered(site))
+
+		self.assertEqual(call_partner.call_count, 2)
+		self.assertFalse(any(call_partner.call_args.kwargs["data"].values()))
@@ -0,0 +1,14 @@
+# Copyright (c) 2026, Pal Shah and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StockSubscriptionWarehouse(Document):
+	pass
+
+
+def on_doctype_update():
+	# get_stock_for_external joins on (parent, warehouse)
+	frappe.db.add_index("Stock Subscription Warehouse", ["parent", "warehouse"])
@@ -49,6 +49,12 @@ frappe.query_reports["External Stock View"] = {
             "label": __("Show Only Available Stock"),
             "fieldtype": "Check",
             "default": 0
+        },
+        {
+            "fieldname": "prepared",
+            "label": __("Use Prepared Results"),
+            "fieldtype": "Check",
+            "default": 1
         }
     ],
     
@@ -90,6 +96,13 @@ frappe.query_reports["External Stock View"] = {
     },
     
     "onload": function(report) {
+        // Reload once the background job has prepared results for the current filters
+        frappe.realtime.on("stock_sync_report_prepared", function() {
+            if (frappe.query_report === report && report.get_values().prepared) {
+                report.refresh();
+            }
+        });
+        
         // Add custom button to refresh data from sites
         report.page.add_inner_button(__("Refresh All Sites"), function() {
             frappe.call({
@@ -3,20 +3,60 @@
 
 # stock_sync/report/external_stock_view/external_stock_view.py
 
+import time
+
 import frappe
 from frappe import _
 from frappe.utils import flt, cint, getdate, nowdate
 
+from stock_sync import report_cache
+from stock_sync.replica import get_max_staleness, replica_read
+
+# Item names live in External Item Metadata, one row per partner item
+ITEM_METADATA_JOIN = """
+    LEFT JOIN `tabExternal Item Metadata` meta
+        ON meta.source_site = esv.source_site
+        AND meta.item_code = esv.item_code
+        AND IFNULL(meta.origin_site, '') = IFNULL(esv.origin_site, '')
+"""
+
 def execute(filters=None):
+    filters = frappe._dict(filters or {})
+
+    # Prepared mode: serve the result prepared in the background for these filters
+    if cint(filters.get("prepared")):
+        prepared = report_cache.get_prepared(filters)
+        if not prepared:
+            return get_columns(), [], _("Preparing results for these filters in the background. "
+                                        "The report refreshes when they are ready.")
+
+        columns, data, prepared_at = prepared
+        return columns, data, _("Prepared at {0}").format(prepared_at)
+
+    return run(filters)
+
+def prepare(key, filters, user=None):
+    """Background job: compute and store the result for one filter set"""
+    filters = frappe._dict(filters)
+    # Moved back by the replica's lag, so syncs it hadn't applied yet still retire the result
+    started_at = time.time() - get_max_staleness()
+    columns, data = run(filters)
+    report_cache.store(key, filters, started_at, columns, data)
+
+    if user:
+        frappe.publish_realtime("stock_sync_report_prepared", {"key": key}, user=user)
+
+@replica_read
+def run(filters):
     columns = get_columns()
     data = get_data(filters)
-    
+
     # Add summary row
     if data:
         summary = get_summary(data)
         data.append([])  # Empty row
         data.append(summary)
-    
+
     return columns, data
 
 def get_columns():
@@ -40,6 +80,12 @@ def get_columns():
             "options": "Site Connection",
             "width": 120
         },
+        {
+            "fieldname": "origin_site",
+            "label": _("Origin Site"),
+            "fieldtype": "Data",
+            "width": 140
+        },
         {
             "fieldname": "warehouse",
             "label": _("Warehouse"),
@@ -91,12 +137,13 @@ def get_columns():
 
 def get_data(filters):
     conditions = get_conditions(filters)
-    
+
     query = """
         SELECT
             esv.item_code,
-            esv.item_name,
+            meta.item_name,
             esv.source_site,
+            esv.origin_site,
             esv.warehouse,
             esv.actual_qty,
             esv.reserved_qty,
@@ -105,36 +152,37 @@ def get_data(filters):
             esv.last_sync,
             TIMESTAMPDIFF(HOUR, esv.last_sync, NOW()) as age
         FROM `tabExternal Stock View` esv
+        {item_metadata_join}
         WHERE esv.docstatus = 0
         {conditions}
         ORDER BY esv.source_site, esv.item_code, esv.warehouse
-    """.format(conditions=conditions)
-    
+    """.format(item_metadata_join=ITEM_METADATA_JOIN, conditions=conditions)
+
     data = frappe.db.sql(query, filters, as_dict=1)
-    
+
     return data
 
 def get_conditions(filters):
     conditions = []
-    
+
     if filters.get("source_site"):
         conditions.append("esv.source_site = %(source_site)s")
-    
+
     if filters.get("item_code"):
         conditions.append("esv.item_code = %(item_code)s")
-    
+
     if filters.get("warehouse"):
         conditions.append("esv.warehouse = %(warehouse)s")
-    
+
     if filters.get("last_sync_from"):
         conditions.append("esv.last_sync >= %(last_sync_from)s")
-    
+
     if filters.get("last_sync_to"):
         conditions.append("esv.last_sync <= DATE_ADD(%(last_sync_to)s, INTERVAL 1 DAY)")
-    
+
     if filters.get("show_only_available"):
         conditions.append("esv.available_qty > 0")
-    
+
     return " AND " + " AND ".join(conditions) if conditions else ""
 
 def get_summary(data):
@@ -143,10 +191,10 @@ def get_summary(data):
     total_reserved_qty = sum([flt(d.reserved_qty) for d in data])
     total_ordered_qty = sum([flt(d.ordered_qty) for d in data])
     total_available_qty = sum([flt(d.available_qty) for d in data])
-    
+
     # Count sites
     sites = set([d.source_site for d in data])
-    
+
     return {
         "item_code": f"<b>{_('SUMMARY')}</b>",
         "item_name": f"<b>{total_items} {_('items from')} {len(sites)} {_('sites')}</b>",
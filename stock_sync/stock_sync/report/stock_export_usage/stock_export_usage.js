@@ -0,0 +1,32 @@
+// Copyright (c) 2026, Pal Shah and contributors
+// For license information, please see license.txt
+
+// stock_sync/report/stock_export_usage/stock_export_usage.js
+
+frappe.query_reports["Stock Export Usage"] = {
+    "filters": [
+        {
+            "fieldname": "user",
+            "label": __("User"),
+            "fieldtype": "Link",
+            "options": "User",
+            "width": "100"
+        },
+        {
+            "fieldname": "only_limited",
+            "label": __("Only Rate Limited Keys"),
+            "fieldtype": "Check",
+            "default": 0
+        }
+    ],
+    
+    "formatter": function(value, row, column, data, default_formatter) {
+        value = default_formatter(value, row, column, data);
+        
+        if (column.fieldname == "limited" && data.limited > 0) {
+            value = `<span style="color: red; font-weight: bold;">${value}</span>`;
+        }
+        
+        return value;
+    }
+};
@@ -0,0 +1,47 @@
+# Copyright (c) 2026, Pal Shah and contributors
+# For license information, please see license.txt
+
+# stock_sync/report/stock_export_usage/stock_export_usage.py
+
+import frappe
+from frappe import _
+
+from stock_sync import rate_limit
+
+
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	data = rate_limit.get_counters()
+
+	if filters.get("user"):
+		data = [row for row in data if row["user"] == filters.user]
+
+	if filters.get("only_limited"):
+		data = [row for row in data if row["limited"]]
+
+	# Heaviest consumers first
+	data.sort(key=lambda row: row["tokens_spent"], reverse=True)
+
+	return get_columns(), data
+
+
+def get_columns():
+	return [
+		{"fieldname": "user", "label": _("User"), "fieldtype": "Link", "options": "User", "width": 180},
+		{"fieldname": "api_key", "label": _("API Key"), "fieldtype": "Data", "width": 140},
+		{"fieldname": "requests", "label": _("Requests"), "fieldtype": "Int", "width": 90},
+		{"fieldname": "limited", "label": _("Limited (429)"), "fieldtype": "Int", "width": 100},
+		{"fieldname": "tokens_spent", "label": _("Tokens Spent"), "fieldtype": "Int", "width": 100},
+		{
+			"fieldname": "tokens",
+			"label": _("Tokens Left"),
+			"fieldtype": "Float",
+			"width": 100,
+			"precision": 2,
+		},
+		{"fieldname": "burst", "label": _("Burst"), "fieldtype": "Float", "width": 80},
+		{"fieldname": "rate_per_minute", "label": _("Tokens / Minute"), "fieldtype": "Float", "width": 110},
+		{"fieldname": "in_flight", "label": _("Exports In Flight"), "fieldtype": "Int", "width": 120},
+		{"fieldname": "max_concurrent", "label": _("Max Concurrent"), "fieldtype": "Int", "width": 110},
+		{"fieldname": "last_request", "label": _("Last Request"), "fieldtype": "Datetime", "width": 160},
+	]
@@ -0,0 +1,216 @@
+# stock_sync/subscription.py - per-partner subscription profiles
+#
+# The consuming site lists the item groups, items and warehouse patterns it wants
+# on its Site Connection and registers them with the source. The source keeps them
+# as a Stock Subscription for the partner's API user, compiled into indexed tables
+# (Stock Subscription Item / Warehouse) that get_stock_for_external joins to.
+import hashlib
+import json
+import traceback
+
+import frappe
+from frappe import _
+
+from stock_sync.partner import call_partner
+
+REGISTER_ENDPOINT = "api/method/stock_sync.subscription.register_subscription"
+
+SUBSCRIPTION_TYPES = {
+	"Item Group": "item_groups",
+	"Item": "items",
+	"Warehouse Pattern": "warehouse_patterns",
+}
+
+
+def split_lines(text):
+	return [line.strip() for line in (text or "").splitlines() if line.strip()]
+
+
+# Source side
+# -----------
+
+
+def compile_items(item_groups, items):
+	"""
+	Item codes in `items` plus every Item in `item_groups` or their descendants
+	"""
+	item_codes = set(items)
+
+	for item_group in item_groups:
+		bounds = frappe.db.get_value("Item Group", item_group, ["lft", "rgt"])
+		if not bounds:
+			continue
+
+		item_codes.update(
+			frappe.db.sql_list(
+				"""
+            SELECT item.name
+            FROM `tabItem` item
+            INNER JOIN `tabItem Group` item_group ON item_group.name = item.item_group
+            WHERE item_group.lft >= %s AND item_group.rgt <= %s
+        """,
+				bounds,
+			)
+		)
+
+	return item_codes
+
+
+def compile_warehouses(patterns):
+	"""
+	Warehouses matching any of `patterns`, where * matches any text
+	"""
+	warehouses = set()
+	for pattern in patterns:
+		like = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("*", "%")
+		warehouses.update(
+			frappe.db.sql_list(
+				"""
+            SELECT name FROM `tabWarehouse` WHERE name LIKE %s
+        """,
+				like,
+			)
+		)
+
+	return warehouses
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def register_subscription(item_groups=None, items=None, warehouse_patterns=None):
+	"""
+	API for OTHER sites to register which of THIS site's stock they want.
+	The subscription belongs to the API user the partner authenticates as;
+	empty lists remove it.
+	"""
+	try:
+		# Security check - ensure API key is provided
+		auth_header = frappe.request.headers.get("Authorization", "")
+		if not auth_header.startswith("token "):
+			frappe.throw(_("Authentication required"), frappe.AuthenticationError)
+
+		values = {
+			"item_groups": "\n".join(_as_list(item_groups)),
+			"items": "\n".join(_as_list(items)),
+			"warehouse_patterns": "\n".join(_as_list(warehouse_patterns)),
+		}
+		user = frappe.session.user
+		name = frappe.db.get_value("Stock Subscription", {"user": user})
+
+		if not any(values.values()):
+			if name:
+				frappe.delete_doc("Stock Subscription", name, ignore_permissions=True)
+			return {"success": True, "subscribed": False}
+
+		doc = frappe.get_doc("Stock Subscription", name) if name else frappe.new_doc("Stock Subscription")
+		doc.update({"user": user, "enabled": 1, **values})
+		doc.save(ignore_permissions=True)
+
+		return {
+			"success": True,
+			"subscribed": True,
+			"items": doc.compiled_item_count if doc.filters_items else None,
+			"warehouses": doc.compiled_warehouse_count if doc.filters_warehouses else None,
+		}
+
+	except frappe.AuthenticationError:
+		return {"success": False, "error": "Authentication failed", "status_code": 401}
+
+	except Exception as e:
+		error_message = f"Subscription API Error: {e!s}"
+		frappe.log_error(
+			title="Stock Subscription API Error", message=f"{error_message}\n{traceback.format_exc()}"
+		)
+		return {"success": False, "error": error_message, "status_code": 500}
+
+
+def _as_list(value):
+	if isinstance(value, str):
+		value = json.loads(value) if value.startswith("[") else split_lines(value)
+	return [str(v).strip() for v in (value or []) if str(v).strip()]
+
+
+def get_user_subscription(user=None):
+	return frappe.db.get_value(
+		"Stock Subscription",
+		{"user": user or frappe.session.user, "enabled": 1},
+		["name", "filters_items", "filters_warehouses"],
+		as_dict=1,
+	)
+
+
+def get_subscription_joins(subscription, item_column, warehouse_column=None):
+	"""
+	(join SQL, params) restricting a query to a compiled subscription
+	"""
+	if not subscription:
+		return "", {}
+
+	joins = []
+	if subscription.filters_items:
+		joins.append(f"""
+            INNER JOIN `tabStock Subscription Item` subscribed_item
+                ON subscribed_item.parent = %(subscription)s
+                AND subscribed_item.item_code = {item_column}""")
+
+	if subscription.filters_warehouses and warehouse_column:
+		joins.append(f"""
+            INNER JOIN `tabStock Subscription Warehouse` subscribed_warehouse
+                ON subscribed_warehouse.parent = %(subscription)s
+                AND subscribed_warehouse.warehouse = {warehouse_column}""")
+
+	return "".join(joins), {"subscription": subscription.name}
+
+
+def recompile_all():
+	"""
+	Scheduled: pick up Items and Warehouses created since subscriptions were compiled
+	"""
+	for name in frappe.get_all("Stock Subscription", filters={"enabled": 1}, pluck="name"):
+		frappe.get_doc("Stock Subscription", name).compile()
+		frappe.db.commit()
+
+
+# Consumer side
+# -------------
+
+
+def get_subscription_payload(site):
+	payload = {fieldname: [] for fieldname in SUBSCRIPTION_TYPES.values()}
+	for row in site.get("subscriptions") or []:
+		fieldname = SUBSCRIPTION_TYPES.get(row.subscription_type)
+		if fieldname and row.value:
+			payload[fieldname].append(row.value.strip())
+
+	return {fieldname: sorted(set(values)) for fieldname, values in payload.items()}
+
+
+def get_subscription_hash(payload):
+	return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def ensure_registered(site):
+	"""
+	Register the Site Connection's subscription with the source, if it
+	changed since it was last registered. Item metadata is pulled in full
+	again afterwards, since Items may have entered the subscription.
+	A site that never subscribed to anything is not registered at all, so
+	partners without the endpoint are left alone.
+	"""
+	payload = get_subscription_payload(site)
+	if not site.subscription_hash and not any(payload.values()):
+		return False
+
+	subscription_hash = get_subscription_hash(payload)
+	if subscription_hash == site.subscription_hash:
+		return False
+
+	call_partner(site, REGISTER_ENDPOINT, data=payload)
+	frappe.db.set_value(
+		"Site Connection",
+		site.name,
+		{"subscription_hash": subscription_hash, "item_metadata_version": None},
+		update_modified=False,
+	)
+	site.subscription_hash = subscription_hash
+	site.item_metadata_version = None
+	return True
@@ -0,0 +1,42 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from stock_sync.checksum import build_checksum_tree, summarize_tree
+from stock_sync.stock_sync.doctype.external_stock_view.test_external_stock_view import stock_row
+
+
+class TestChecksumTree(FrappeTestCase):
+	def setUp(self):
+		self.rows = [
+			stock_row(f"ITEM-{index}", warehouse, qty=index)
+			for index in range(50)
+			for warehouse in ("Stores", "Finished Goods")
+		]
+
+	def test_tree_ignores_row_order(self):
+		self.assertEqual(build_checksum_tree(self.rows), build_checksum_tree(list(reversed(self.rows))))
+
+	def test_change_is_confined_to_its_warehouse_and_bucket(self):
+		changed = [dict(row) for row in self.rows]
+		changed[0]["actual_qty"] += 1
+
+		tree, changed_tree = build_checksum_tree(self.rows), build_checksum_tree(changed)
+		root, warehouses = summarize_tree(tree)
+		changed_root, changed_warehouses = summarize_tree(changed_tree)
+
+		self.assertNotEqual(root, changed_root)
+		self.assertEqual(
+			[warehouse for warehouse in warehouses if warehouses[warehouse] != changed_warehouses[warehouse]],
+			[changed[0]["warehouse"]],
+		)
+		buckets, changed_buckets = tree[changed[0]["warehouse"]], changed_tree[changed[0]["warehouse"]]
+		self.assertEqual(len([bucket for bucket in buckets if buckets[bucket] != changed_buckets[bucket]]), 1)
+
+	def test_quantities_compare_at_checksum_precision(self):
+		rounded = [dict(row, actual_qty=row["actual_qty"] + 1e-9) for row in self.rows]
+
+		self.assertEqual(
+			summarize_tree(build_checksum_tree(self.rows))[0], summarize_tree(build_checksum_tree(rounded))[0]
+		)
@@ -0,0 +1,68 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from stock_sync.decoder import DATA_MAX_LENGTH, decode_stock_rows
+
+
+class TestStockRowDecoder(FrappeTestCase):
+	def test_coerces_values_and_fills_defaults(self):
+		rows, rejects = decode_stock_rows(
+			[
+				{
+					"item_code": " ITEM-A ",
+					"warehouse": "Stores",
+					"actual_qty": "5",
+					"source_site": "a.example.com",
+				}
+			]
+		)
+
+		self.assertEqual(rejects["total"], 0)
+		self.assertEqual(rows[0]["item_code"], "ITEM-A")
+		self.assertEqual(rows[0]["actual_qty"], 5.0)
+		self.assertEqual(rows[0]["reserved_qty"], 0.0)
+		self.assertEqual(rows[0]["origin_site"], "a.example.com")
+
+	def test_rejects_are_counted_by_reason(self):
+		rows, rejects = decode_stock_rows(
+			[
+				{"item_code": "ITEM-A", "warehouse": "Stores", "actual_qty": 1},
+				{"warehouse": "Stores"},
+				{"item_code": "ITEM-B", "warehouse": "Stores", "actual_qty": "many"},
+				{"item_code": "ITEM-C", "warehouse": "Stores", "available_qty": float("nan")},
+				{"item_code": "ITEM-D", "warehouse": "Stores", "reserved_qty": True},
+				{"item_code": "X" * (DATA_MAX_LENGTH + 1), "warehouse": "Stores"},
+				{"item_code": {"name": "ITEM-E"}, "warehouse": "Stores"},
+				["ITEM-F", "Stores"],
+			]
+		)
+
+		self.assertEqual([row["item_code"] for row in rows], ["ITEM-A"])
+		self.assertEqual(rejects["total"], 7)
+		self.assertEqual(
+			rejects["reasons"],
+			{
+				"missing_item_code": 1,
+				"not_a_number:actual_qty": 1,
+				"not_finite:available_qty": 1,
+				"not_a_number:reserved_qty": 1,
+				"too_long:item_code": 1,
+				"not_text:item_code": 1,
+				"not_an_object": 1,
+			},
+		)
+
+	def test_samples_are_capped_per_reason(self):
+		_rows, rejects = decode_stock_rows([{"warehouse": "Stores"}] * 20)
+
+		self.assertEqual(rejects["reasons"], {"missing_item_code": 20})
+		self.assertLessEqual(len(rejects["samples"]["missing_item_code"]), 5)
+
+	def test_rejects_add_up_across_payloads(self):
+		_rows, rejects = decode_stock_rows([{"warehouse": "Stores"}])
+		_rows, rejects = decode_stock_rows([{"warehouse": "Stores"}, ["ITEM-A"]], rejects=rejects)
+
+		self.assertEqual(rejects["total"], 3)
+		self.assertEqual(rejects["reasons"], {"missing_item_code": 2, "not_an_object": 1})
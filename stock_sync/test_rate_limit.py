@@ -0,0 +1,63 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from stock_sync import rate_limit
+
+
+class TestRateLimit(FrappeTestCase):
+	def setUp(self):
+		self.api_key = f"_test-{frappe.generate_hash(length=10)}"
+
+	def tearDown(self):
+		bucket_key, in_flight_key, keys_key = rate_limit._keys(self.api_key)
+		rate_limit._redis("DEL", bucket_key, in_flight_key)
+		rate_limit._redis("SREM", keys_key, self.api_key)
+
+	def acquire(self, limits, cost=1):
+		with patch.object(rate_limit, "get_limits", return_value={**rate_limit.DEFAULT_LIMITS, **limits}):
+			return rate_limit.acquire(self.api_key, cost, frappe.generate_hash(length=16))
+
+	def test_bucket_allows_burst_then_limits(self):
+		limits = {"rate_per_minute": 6, "burst": 3, "max_concurrent": 0}
+
+		self.assertEqual([self.acquire(limits)[0] for _ in range(3)], [True, True, True])
+
+		allowed, retry_after, reason = self.acquire(limits)
+		self.assertFalse(allowed)
+		self.assertEqual(reason, "rate")
+		self.assertGreaterEqual(retry_after, 1)
+
+	def test_full_export_costs_more(self):
+		limits = {"rate_per_minute": 6, "burst": rate_limit.FULL_EXPORT_COST, "max_concurrent": 0}
+
+		self.assertTrue(self.acquire(limits, cost=rate_limit.FULL_EXPORT_COST)[0])
+		self.assertFalse(self.acquire(limits, cost=rate_limit.FILTERED_EXPORT_COST)[0])
+
+	def test_concurrency_quota(self):
+		limits = {"rate_per_minute": 600, "burst": 100, "max_concurrent": 1}
+		request_id = frappe.generate_hash(length=16)
+
+		with patch.object(rate_limit, "get_limits", return_value={**rate_limit.DEFAULT_LIMITS, **limits}):
+			self.assertTrue(rate_limit.acquire(self.api_key, 1, request_id)[0])
+
+		self.assertEqual(self.acquire(limits), (False, rate_limit.CONCURRENCY_RETRY_AFTER, "concurrency"))
+
+		rate_limit.release(self.api_key, request_id)
+		self.assertTrue(self.acquire(limits)[0])
+
+	def test_counters_report_usage(self):
+		limits = {"rate_per_minute": 6, "burst": 1, "max_concurrent": 0}
+		self.acquire(limits)
+		self.acquire(limits)
+
+		with patch.object(rate_limit, "get_limits", return_value={**rate_limit.DEFAULT_LIMITS, **limits}):
+			counters = next(row for row in rate_limit.get_counters() if row["api_key"] == self.api_key)
+
+		self.assertEqual(counters["requests"], 2)
+		self.assertEqual(counters["limited"], 1)
+		self.assertEqual(counters["tokens_spent"], 1)
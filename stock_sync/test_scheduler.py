@@ -0,0 +1,80 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_to_date, now_datetime
+
+from stock_sync import scheduler
+
+TEST_SITE = "_test-scheduler-site.example.com"
+
+
+class TestScheduler(FrappeTestCase):
+	def setUp(self):
+		self.site = frappe._dict(name=TEST_SITE, min_sync_interval=5, max_sync_interval=240)
+		frappe.get_doc(
+			{
+				"doctype": "Site Connection",
+				"site_name": TEST_SITE,
+				"site_url": f"https://{TEST_SITE}/",
+				"api_key": "_test",
+			}
+		).insert(ignore_permissions=True)
+
+	def tearDown(self):
+		frappe.db.rollback()
+
+	def add_log(self, minutes_ago, status="Success", sync_type="Sync", changed=0):
+		frappe.get_doc(
+			{
+				"doctype": "Stock Sync Log",
+				"site": TEST_SITE,
+				"sync_date": add_to_date(now_datetime(), minutes=-minutes_ago),
+				"status": status,
+				"sync_type": sync_type,
+				"updated_count": changed,
+			}
+		).insert(ignore_permissions=True)
+
+	def test_interval_targets_changes_per_sync(self):
+		self.assertEqual(scheduler.get_next_interval(self.site, 1), 50)
+		self.assertEqual(scheduler.get_next_interval(self.site, 100), 5)
+		self.assertEqual(scheduler.get_next_interval(self.site, 0.01), 240)
+
+	def test_interval_without_history_or_changes(self):
+		self.assertEqual(scheduler.get_next_interval(self.site, None), 5)
+		self.assertEqual(scheduler.get_next_interval(self.site, 0), 240)
+
+	def test_interval_backs_off_on_failures(self):
+		self.assertEqual(scheduler.get_next_interval(self.site, 100, failures=1), 10)
+		self.assertEqual(scheduler.get_next_interval(self.site, 100, failures=3), 40)
+		self.assertEqual(scheduler.get_next_interval(self.site, 100, failures=10), 240)
+
+	def test_max_interval_never_below_min(self):
+		site = frappe._dict(min_sync_interval=30, max_sync_interval=10)
+
+		self.assertEqual(scheduler.get_interval_bounds(site), (30, 30))
+		self.assertEqual(scheduler.get_next_interval(site, 0), 30)
+
+	def test_change_rate_reads_successful_syncs(self):
+		self.assertIsNone(scheduler.get_change_rate(TEST_SITE))
+
+		# The oldest sync only marks the start of the window: its changes happened before it
+		self.add_log(30, changed=1000)
+		self.add_log(20, changed=10)
+		self.add_log(10, changed=20)
+		self.add_log(5, status="Failed", changed=500)
+		self.add_log(1, sync_type="Reconcile", changed=500)
+
+		self.assertAlmostEqual(scheduler.get_change_rate(TEST_SITE), 1.5, places=2)
+
+	def test_failure_streak_counts_since_last_success(self):
+		self.add_log(30, status="Failed")
+		self.add_log(20)
+		self.assertEqual(scheduler.get_failure_streak(TEST_SITE), 0)
+
+		self.add_log(10, status="Failed")
+		self.add_log(5, status="Failed")
+		self.add_log(1, sync_type="Reconcile")
+		self.assertEqual(scheduler.get_failure_streak(TEST_SITE), 2)
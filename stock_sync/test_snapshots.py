@@ -0,0 +1,139 @@
+# Copyright (c) 2026, Pal Shah and Contributors
+# See license.txt
+
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+from unittest.mock import patch
+
+import frappe
+import requests
+from frappe.tests.utils import FrappeTestCase
+
+from stock_sync import snapshots
+
+ROWS = [{"item_code": f"ITEM-{index}", "warehouse": "Stores", "actual_qty": index} for index in range(200)]
+
+
+def make_snapshot(rows):
+	payload = json.dumps(rows, separators=(",", ":")).encode()
+	return hashlib.sha1(payload).hexdigest()[:16], gzip.compress(payload, mtime=0)
+
+
+class FakeResponse:
+	def __init__(self, status_code, body=b""):
+		self.status_code = status_code
+		self.body = body
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+	def raise_for_status(self):
+		if self.status_code >= 400:
+			raise requests.HTTPError(response=self)
+
+	def iter_content(self, chunk_size):
+		for start in range(0, len(self.body), chunk_size):
+			yield self.body[start : start + chunk_size]
+
+
+class TestSnapshots(FrappeTestCase):
+	def setUp(self):
+		self.site = frappe._dict(
+			name="_test-snapshot-site.example.com",
+			site_url="https://_test-snapshot-site.example.com/",
+			api_key="_test",
+			api_secret="_test",
+			snapshot_version=None,
+		)
+		self.version, self.body = make_snapshot(ROWS)
+		self.info = {
+			"version": self.version,
+			"size": len(self.body),
+			"url": f"{snapshots.DOWNLOAD_ENDPOINT}?version={self.version}",
+		}
+		prefix = hashlib.sha1(self.site.name.encode()).hexdigest()[:12]
+		self.part_path = snapshots.get_snapshot_dir("downloads", f"{prefix}-{self.version}.part")
+
+	def tearDown(self):
+		with contextlib.suppress(FileNotFoundError):
+			os.remove(self.part_path)
+
+	def write_partial(self, data):
+		os.makedirs(os.path.dirname(self.part_path), exist_ok=True)
+		with open(self.part_path, "wb") as f:
+			f.write(data)
+
+	def read_partial(self):
+		with open(self.part_path, "rb") as f:
+			return f.read()
+
+	def test_resumes_from_partial_download(self):
+		half = len(self.body) // 2
+		self.write_partial(self.body[:half])
+
+		with patch.object(snapshots.requests, "get", return_value=FakeResponse(206, self.body[half:])) as get:
+			snapshots.download(self.site, self.info)
+
+		self.assertEqual(get.call_args.kwargs["headers"]["Range"], f"bytes={half}-")
+		self.assertEqual(self.read_partial(), self.body)
+
+	def test_range_not_satisfiable_starts_over(self):
+		self.write_partial(b"stale bytes")
+
+		with patch.object(
+			snapshots.requests, "get", side_effect=[FakeResponse(416), FakeResponse(200, self.body)]
+		) as get:
+			snapshots.download(self.site, self.info)
+
+		self.assertEqual(get.call_args.kwargs["headers"]["Range"], "bytes=0-")
+		self.assertEqual(self.read_partial(), self.body)
+
+	def test_full_response_overwrites_partial(self):
+		self.write_partial(self.body[:10])
+
+		with patch.object(snapshots.requests, "get", return_value=FakeResponse(200, self.body)):
+			snapshots.download(self.site, self.info)
+
+		self.assertEqual(self.read_partial(), self.body)
+
+	def test_fetch_verifies_and_decodes(self):
+		with (
+			patch.object(
+				snapshots, "call_partner", return_value={"site": "a.example.com", "snapshot": self.info}
+			),
+			patch.object(snapshots.requests, "get", return_value=FakeResponse(200, self.body)),
+		):
+			self.assertEqual(snapshots.fetch_snapshot(self.site), (self.version, ROWS))
+
+		self.assertEqual(self.site.remote_site_name, "a.example.com")
+		self.assertFalse(os.path.exists(self.part_path))
+
+	def test_fetch_skips_applied_version(self):
+		self.site.snapshot_version = self.version
+
+		with (
+			patch.object(snapshots, "call_partner", return_value={"snapshot": self.info}),
+			patch.object(snapshots.requests, "get") as get,
+		):
+			self.assertEqual(snapshots.fetch_snapshot(self.site), (self.version, None))
+
+		get.assert_not_called()
+
+	def test_fetch_rejects_content_not_matching_version(self):
+		_version, tampered = make_snapshot(ROWS[:-1])
+		info = dict(self.info, size=len(tampered))
+
+		with (
+			patch.object(snapshots, "call_partner", return_value={"snapshot": info}),
+			patch.object(snapshots.requests, "get", return_value=FakeResponse(200, tampered)),
+			self.assertRaises(frappe.ValidationError),
+		):
+			snapshots.fetch_snapshot(self.site)
+
+		self.assertFalse(os.path.exists(self.part_path))